@@ -18,6 +18,11 @@ from os import path, listdir
 from discord.ext.commands import AutoShardedBot, when_mentioned_or, Context
 from discord import DMChannel, Intents, AllowedMentions, Status
 from aiohttp import ClientSession, ClientTimeout
+from db.batch import batch_writer
+from db.config import engine
+from tools.message_pipeline import MessagePipeline, MessageView
+from tools.qr_service import start_pool, shutdown_pool
+from tools.state_store import StateStore
 
 
 class Felix(AutoShardedBot):
@@ -30,15 +35,27 @@ class Felix(AutoShardedBot):
         self.status = Status.online
         with open('../config.json') as conffile:
             self.config = json.load(conffile)
+        self.reload_permissions()
+        # Contents of state.json - shared by all cogs
+        self.state = StateStore('../state.json')
         self.last_errors = []
+        # Cogs register their message checks here instead of using on_message listeners
+        self.pipeline = MessagePipeline(on_error=self.log_error)
 
     async def start(self, *args, **kwargs):
         self.session = ClientSession(timeout=ClientTimeout(total=30))
         await super().start(*args, **kwargs)
 
     async def close(self):
-        await self.session.close()
         await super().close()
+        # Closed after the cogs were unloaded, so they can still finish their uploads
+        await self.session.close()
+        # Write pending state changes (cogs are unloaded at this point)
+        await self.state.flush()
+        await batch_writer.flush()
+        # Pooled connections keep their threads alive until the pool is disposed
+        await engine.dispose()
+        shutdown_pool()
 
     async def setup_hook(self):
         print('Loading Extensions:')
@@ -57,17 +74,36 @@ class Felix(AutoShardedBot):
                 exc = f'{type(e).__name__}: {e}'
                 print(f'Failed to load extension {extension}\n{exc}')
 
+    # ----------------------------------------------
+    # Permissions
+    # ----------------------------------------------
+    def reload_permissions(self):
+        """Rebuild the permission sets from the config and forget all memoized checks
+
+        Has to be called whenever self.config is replaced or changed.
+        """
+        self.admin_roles = frozenset(self.config['admin_roles'])
+        self.superusers = frozenset(self.config['superusers'])
+        # (guild id, member id) -> is_admin
+        self.permission_cache = {}
+
+    def forget_permissions(self, member):
+        self.permission_cache.pop((member.guild.id, member.id), None)
+
     def user_is_admin(self, user):
         try:
-            user_roles = [role.id for role in user.roles]
+            key = (user.guild.id, user.id)
         except AttributeError:
+            # Users that are not members of a guild don't have roles
             return False
-        permitted_roles = self.config['admin_roles']
-        return any(role in permitted_roles for role in user_roles)
+        is_admin = self.permission_cache.get(key)
+        if is_admin is None:
+            is_admin = not self.admin_roles.isdisjoint(role.id for role in user.roles)
+            self.permission_cache[key] = is_admin
+        return is_admin
 
     def user_is_superuser(self, user):
-        superusers = self.config['superusers']
-        return user.id in superusers
+        return user.id in self.superusers
 
     async def log_error(self, error, error_source=None):
         is_context = isinstance(error_source, Context)
@@ -118,13 +154,36 @@ async def on_error(event_method, *args, **kwargs):
     await client.log_error(sys.exc_info()[1], 'DEFAULT HANDLER:' + event_method)
 
 
+@client.event
+async def on_member_update(before, after):
+    if before.roles != after.roles:
+        client.forget_permissions(after)
+
+
+@client.event
+async def on_member_remove(member):
+    client.forget_permissions(member)
+
+
+@client.event
+async def on_guild_role_delete(role):
+    # Members lose the role without an on_member_update
+    client.permission_cache.clear()
+
+
 @client.event
 async def on_message(msg):
     # Ignore DMs
     if isinstance(msg.channel, DMChannel):
         return
+    view = MessageView.from_message(msg, client)
+    if await client.pipeline.dispatch(view):
+        # The message was consumed (deleted) by one of the stages
+        return
     await client.process_commands(msg)
 
 
+# The QR workers are forked, this has to happen before the client starts its threads
+start_pool()
 client.run(client.config['bot_key'])
 print('Felix-Python has exited')
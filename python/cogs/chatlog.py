@@ -2,11 +2,14 @@
 It will log all messages the bot can see to a file and to the emkc chatlog api
 
 Commands:
-    None
+    chatlog         show the state of the emkc upload queue
+
+Only users that have an admin role can use the commands.
 
 """
 from discord.ext import commands
-from discord import DMChannel
+from tools.emkc_uploader import EmkcUploader
+from tools.log_writer import LogWriter
 
 
 # set up log path
@@ -16,16 +19,29 @@ LOG_FILENAME = '../logs/discord_chat.log'
 class ChatLog(commands.Cog, name='Chat Log'):
     def __init__(self, client):
         self.client = client
-        self.logfile = open(LOG_FILENAME, 'a', encoding='utf-8')
+        # Lines are written and rotated in the background, see tools/log_writer.py
+        self.log_writer = LogWriter(LOG_FILENAME)
+        self.log_writer.start()
+        # Uploads to emkc run in the background so the message pipeline doesn't wait for them
+        self.uploader = EmkcUploader(
+            self.client.session,
+            headers={'authorization': self.client.config['emkc_key']}
+        )
+        self.uploader.start()
+        # Runs first so messages are logged before they can get deleted by moderation stages
+        self.client.pipeline.register('Chat Log', self.inspect_message, order=0)
 
-    @commands.Cog.listener()
-    async def on_message(self, msg):
-        if msg.author.bot:
-            # Dont log messages of bots
-            return
-        if isinstance(msg.channel, DMChannel):
-            # Don't log DMs
-            return
+    async def cog_unload(self):
+        self.client.pipeline.unregister('Chat Log')
+        # Bot.close unloads all cogs, so this also drains the queue on shutdown
+        await self.log_writer.close()
+        await self.uploader.close()
+
+    async def cog_check(self, ctx):
+        return self.client.user_is_admin(ctx.author)
+
+    async def inspect_message(self, view):
+        msg = view.msg
         if not msg.channel.guild.id == self.client.main_guild.id:
             # Don't log messages on servers other than the main server
             return
@@ -36,31 +52,41 @@ class ChatLog(commands.Cog, name='Chat Log'):
             msg.content.replace('\n', '\\n'),
             msg.author.id
         ]
-        self.logfile.write('|'.join(paginator[:-1]) + '\n')
-        self.logfile.flush()
+        self.log_writer.write('|'.join(paginator[:-1]))
 
         # send chat message to emkc
         if not msg.channel.guild.id == 473161189120147456:
             # prevent querying the emkc api if it's not felix
             return
 
-        headers = {
-            'authorization': self.client.config['emkc_key']
-        }
-        data = {
+        self.uploader.upload({
             'timestamp': paginator[0],
             'channel': paginator[1],
             'user': paginator[2],
             'message': paginator[3],
             'discord_id': paginator[4]
-        }
-        async with self.client.session.post(
-            'https://emkc.org/api/internal/chats',
-            headers=headers,
-            data=data
-        ) as response:
-            if response.status != 200:
-                print(f'ERROR while sending chat log to EMKC. Response {response.status}')
+        })
+
+    @commands.command(
+        name='chatlog',
+        hidden=True,
+    )
+    async def chatlog(self, ctx):
+        """Show the state of the emkc upload queue"""
+        metrics = self.uploader.metrics
+        await ctx.send(
+            '```\n'
+            f'queued      {self.uploader.depth}\n'
+            f'oldest      {self.uploader.oldest_age:.1f} s\n'
+            f'sent        {metrics.sent}\n'
+            f'retried     {metrics.retried}\n'
+            f'dropped     {metrics.dropped}\n'
+            f'spilled     {metrics.spilled}\n'
+            f'replayed    {metrics.replayed}\n'
+            f'last lag    {metrics.last_lag:.1f} s\n'
+            f'max lag     {metrics.max_lag:.1f} s\n'
+            '```'
+        )
 
 
 async def setup(client):
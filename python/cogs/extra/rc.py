@@ -21,19 +21,21 @@ class RemoteControl(commands.Cog, command_attrs=dict(hidden=True)):
         self.rc_user = None
         self.rc_target_channel = None
         self.rc_active = False
+        self.client.pipeline.register('Remote Control', self.inspect_message, order=40)
+
+    def cog_unload(self):
+        self.client.pipeline.unregister('Remote Control')
 
     async def cog_check(self, ctx):
         return self.client.user_is_admin(ctx.author)
 
     # ----------------------------------------------
-    # Cog Event listeners
+    # Message stage and event listeners
     # ----------------------------------------------
-    @commands.Cog.listener()
-    async def on_message(self, msg):
+    async def inspect_message(self, view):
         if not self.rc_active:
             return
-        if msg.author.bot:
-            return
+        msg = view.msg
         if msg.channel == self.rc_target_channel:
             await self.rc_channel.send(msg.author.name + ':  ' + msg.content)
         elif msg.channel == self.rc_channel:
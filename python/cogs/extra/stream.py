@@ -34,29 +34,17 @@ class Stream(commands.Cog, name='Stream'):
     # ----------------------------------------------
     # Helper Functions
     # ----------------------------------------------
-    def load_state(self):
-        with open("../state.json", "r") as statefile:
-            return json.load(statefile)
-
     def load_refresh_token(self):
-        state = self.load_state()
-        return state.get('refresh_token', '')
+        return self.client.state.get('refresh_token', '')
 
     def save_refresh_token(self, refresh_token):
-        state = self.load_state()
-        state['refresh_token'] = refresh_token
-        with open("../state.json", "w") as statefile:
-            return json.dump(state, statefile, indent=1)
+        self.client.state.set('refresh_token', refresh_token)
 
     def load_stream_channels(self):
-        state = self.load_state()
-        return state.get('stream_channels', [])
+        return self.client.state.get('stream_channels', [])
 
     def save_stream_channels(self, stream_channels):
-        state = self.load_state()
-        state['stream_channels'] = stream_channels
-        with open("../state.json", "w") as statefile:
-            return json.dump(state, statefile, indent=1)
+        self.client.state.set('stream_channels', stream_channels)
 
     def set_up_api(self, credentials):
         self.youtube_api = googleapiclient.discovery.build(
@@ -5,7 +5,7 @@ from curses.ascii import isdigit
 import random
 from datetime import datetime as dt
 from discord.ext import commands
-from discord import Activity, DMChannel
+from discord import Activity
 
 
 class Talkback(commands.Cog, command_attrs=dict(hidden=True)):
@@ -17,6 +17,10 @@ class Talkback(commands.Cog, command_attrs=dict(hidden=True)):
         random.seed()
         self.modes = {'yarr':self.get_yarr, 'australia' : self.get_australia}
         self.mode = self.get_yarr
+        self.client.pipeline.register('Talkback', self.inspect_message, order=90)
+
+    def cog_unload(self):
+        self.client.pipeline.unregister('Talkback')
 
     async def cog_check(self, ctx):
         return self.client.user_is_admin(ctx.author)
@@ -85,13 +89,8 @@ class Talkback(commands.Cog, command_attrs=dict(hidden=True)):
             raise commands.BadArgument('Invalid cooldown')
         await ctx.send(f'Changed cooldown to {new_cd} seconds')
 
-    @commands.Cog.listener()
-    async def on_message(self, msg):
-        if msg.author.bot:
-            return
-        if isinstance(msg.channel, DMChannel):
-            # Ignore DM
-            return
+    async def inspect_message(self, view):
+        msg = view.msg
         if random.randint(0, 99 // self.chance) == 0:
             if (dt.utcnow() - self.last_talkback).total_seconds() < self.cooldown:
                 return
@@ -417,6 +417,10 @@ class Hangman(commands.Cog):
         # A dict which stores currently active games
         # Key: user_id | Value: HangmanGame instance
         self.active_games = {}
+        self.client.pipeline.register('Hangman', self.inspect_message, order=60)
+
+    def cog_unload(self):
+        self.client.pipeline.unregister('Hangman')
 
     async def get_words(self, amount=100):
         async with self.client.session.get(
@@ -427,8 +431,8 @@ class Hangman(commands.Cog):
         words = sample(text.split(), 200)
         return [i.strip() for i in words if len(i) >= MIN_LENGTH]
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
+    async def inspect_message(self, view):
+        message = view.msg
         # A hacky way to detect if user is typing a command
         if ' ' in message.content:
             return
@@ -447,6 +451,7 @@ class Hangman(commands.Cog):
             game.last_user_message = message
             if game.is_complete:
                 del self.active_games[_id]
+            return True
 
     @commands.command(
         name="hangman"
@@ -616,6 +621,10 @@ class Mastermind(commands.Cog, name='Mastermind'):
     def __init__(self, client):
         self.client = client
         self.active_games = []
+        self.client.pipeline.register('Mastermind', self.inspect_message, order=60)
+
+    def cog_unload(self):
+        self.client.pipeline.unregister('Mastermind')
 
     # ----------------------------------------------
     # Cog Commands
@@ -686,9 +695,9 @@ class Mastermind(commands.Cog, name='Mastermind'):
                       )
         await ctx.send(embed=embed)
 
-    @commands.Cog.listener()
-    async def on_message(self, message):
+    async def inspect_message(self, view):
         """Make a guess for your running mastermind game"""
+        message = view.msg
         # A hacky way to detect if user is typing a command
         if ' ' in message.content:
             return
@@ -697,9 +706,9 @@ class Mastermind(commands.Cog, name='Mastermind'):
             if game.player == message.author and game.channel == message.channel:
                 current_game = game
                 break
-        ctx = await self.client.get_context(message)
         if not current_game:
             return False
+        ctx = await self.client.get_context(message)
         guess = message.content
         if guess in ('q', 'quit'):
             loser = True
@@ -24,23 +24,109 @@ import re
 import random
 import typing
 import hashlib
+from io import BytesIO
 from inspect import getsourcelines
 from datetime import datetime as dt, timedelta as td
 from urllib.parse import quote_plus
 from aiohttp import ContentTypeError
 import discord
 from discord.ext import commands, tasks
-from discord import Embed, DMChannel, Member, File
-from tools.qr import generate_qr_code
+from discord import Embed, Member, File
+from tools.qr_decode import QRDecodeError
+from tools.qr_service import QRService, QueueFull
+from tools.triggers import Trigger, TriggerEngine
 # pylint: disable=E1101
 
+# Largest image that is accepted by the qr decode command
+MAX_QR_IMAGE_SIZE = 8 * 1024 * 1024
+
+RE_CONVERT = re.compile(r'(?i)(?: |^)(?P<num>-?[0-9]+(?:\.[0-9]*)?)\s?(?P<unit>[a-zA-Z°²]+)')
+
+UNIT_ALIASES = {
+    'mile': 'miles',
+    'kilometer': 'km',
+    'kilometers': 'km',
+    'kilometre': 'km',
+    'kilometres': 'km',
+    'f': '°f',
+    'fahrenheit': '°f',
+    '°fahrenheit': '°f',
+    'c': '°c',
+    'celsius': '°c',
+    '°celsius': '°c',
+    'feet': 'ft',
+    'ounce': 'ounces',
+    'inch': 'inches',
+    'centimeters': 'cm',
+    'centimetres': 'cm',
+    'squaremeter': 'm²',
+    'squaremetre': 'm²',
+    'sqm': 'm²',
+    'squarefoot': 'ft²',
+    'squarefeet': 'ft²',
+    'sqft': 'ft²',
+}
+
+CONVERSIONS = {
+    'miles': (lambda x: x*1.609344, 'km'),
+    'km': (lambda x: x*0.6213712, 'miles'),
+    '°f': (lambda x: (x-32)/1.8, '°C'),
+    '°c': (lambda x: x*1.8+32, '°F'),
+    'lb': (lambda x: x*0.4535924, 'kg'),
+    'kg': (lambda x: x*2.204623, 'lb'),
+    'ft': (lambda x: x*0.3048, 'm'),
+    'yards': (lambda x: x*0.3048*3, 'm'),
+    'ounces': (lambda x: x*28.35, 'g'),
+    'inches': (lambda x: x*2.54, 'cm'),
+    'cm': (lambda x: x*0.3937, 'inches'),
+    'm²': (lambda x: x*10.764, 'ft²'),
+    'ft²': (lambda x: x*0.09290304, 'm²'),
+}
+
+
+def entropy_answer(cog):
+    if random.random() >= 0.5:
+        return 'the answer I am getting from my entropy is: Yes.'
+    return 'the answer I am getting from my entropy is: No.'
+
+
+# Responses to messages, checked in this order - all matching triggers respond
+# More triggers can be added in config.json:
+#     "triggers": [{"pattern": "^felix woof", "response": "woof"}]
+TRIGGERS = (
+    Trigger('twist', r'what a twist', '` - directed by M. Night Shyamalan.`'),
+    Trigger(
+        'year',
+        r'(?:the|this) (?:current )?year is (?:almost |basically )?(?:over|done|finished)',
+        lambda cog: cog.get_year_string(),
+    ),
+    Trigger('bobs', r'send bobs and vagene', '😏 *sensible chuckle*'),
+    Trigger('hello', r'^(?:hi|what\'s up|yo|hey|hello) felix', 'hello'),
+    Trigger('should', r'^felix should (?:i|he|she|they|we|<@!?\d+>)', entropy_answer),
+    Trigger('html', r'^html is a programming language', 'no it\'s not, don\'t be silly'),
+    Trigger('fight', r'^you wanna fight, felix\?', 'bring it on pal (╯°□°）╯︵ ┻━┻'),
+    Trigger('arrays 0', r'^arrays start at 0', 'arrays definitely start at 0'),
+    Trigger('arrays 1', r'^arrays start at 1', 'arrays do not start at 1, they start at 0'),
+    Trigger('meow', r'^felix meow', 'ฅ^•ﻌ•^ฅ'),
+    Trigger(
+        'answer',
+        r'^felix what(?:\'s| is) the answer to life,? the universe and everything',
+        '42',
+    ),
+)
+
 
 class General(commands.Cog, name='General'):
     def __init__(self, client):
         self.client = client
         self.load_cat_http_codes.start()
         self.load_dog_http_codes.start()
-        self.re_convert = re.compile(r'(?i)(?: |^)(?P<num>-?[0-9]+(?:\.[0-9]*)?)\s?(?P<unit>[a-zA-Z°²]+)')
+        self.build_triggers()
+        self.qr_service = QRService()
+        self.client.pipeline.register('General', self.inspect_message, order=50)
+
+    def cog_unload(self):
+        self.client.pipeline.unregister('General')
 
     @tasks.loop(count=1)
     async def load_cat_http_codes(self):
@@ -62,6 +148,21 @@ class General(commands.Cog, name='General'):
     # ----------------------------------------------
     # Helper Functions
     # ----------------------------------------------
+    def build_triggers(self):
+        """Compile the built in triggers and the triggers from the config"""
+        self.trigger_config = self.client.config
+        triggers = list(TRIGGERS)
+        for index, entry in enumerate(self.trigger_config.get('triggers', [])):
+            try:
+                re.compile(entry['pattern'])
+                if not isinstance(entry['response'], str):
+                    raise TypeError('response is not a string')
+            except (KeyError, TypeError, re.error) as e:
+                print(f'Ignoring invalid trigger {index} in config.json: {e!r}')
+                continue
+            triggers.append(Trigger(f'config {index}', entry['pattern'], entry['response']))
+        self.triggers = TriggerEngine(triggers)
+
     def get_year_string(self):
         now = dt.utcnow()
         year_end = dt(now.year+1, 1, 1)
@@ -140,132 +241,26 @@ class General(commands.Cog, name='General'):
             await ctx.send(embed=embed)
 
     # ----------------------------------------------
-    # Cog Event listeners
+    # Message stage
     # ----------------------------------------------
-    @commands.Cog.listener()
-    async def on_message(self, msg):
-        # Ignore messages sent by bots
-        if msg.author.bot:
-            return
-
-        # Ignore DM
-        if isinstance(msg.channel, DMChannel):
-            return
-
-        if re.search(r'(?i).*what a twist.*', msg.content):
-            await msg.channel.send('` - directed by M. Night Shyamalan.`')
-
-        if re.search(
-            r'(?i)(?:the|this) (?:current )?year is '
-            + r'(?:almost |basically )?(?:over|done|finished)',
-            msg.content
-        ):
-            await msg.channel.send(self.get_year_string())
-
-        if re.search(
-            r'(?i)send bobs and vagene',
-            msg.content
-        ):
-            await msg.channel.send('😏 *sensible chuckle*')
-
-        if re.search(
-            r'(?i)^(?:hi|what\'s up|yo|hey|hello) felix',
-            msg.content
-        ):
-            await msg.channel.send('hello')
-
-        if re.search(
-            r'(?i)^felix should (?:i|he|she|they|we|<@!?\d+>)',
-            msg.content
-        ):
-            if random.random() >= 0.5:
-                response = 'the answer I am getting from my entropy is: Yes.'
-            else:
-                response = 'the answer I am getting from my entropy is: No.'
+    async def inspect_message(self, view):
+        msg = view.msg
+        if self.client.config is not self.trigger_config:
+            # The config was reloaded, pick up changed triggers
+            self.build_triggers()
+        for trigger in self.triggers.matches(view.content):
+            response = trigger.response
+            if callable(response):
+                response = response(self)
             await msg.channel.send(response)
 
-        if re.search(
-            r'(?i)^html is a programming language',
-            msg.content
-        ):
-            await msg.channel.send('no it\'s not, don\'t be silly')
-
-        if re.search(
-            r'(?i)^you wanna fight, felix\?',
-            msg.content
-        ):
-            await msg.channel.send('bring it on pal (╯°□°）╯︵ ┻━┻')
-
-        if re.search(
-            r'(?i)^arrays start at 0',
-            msg.content
-        ):
-            await msg.channel.send('arrays definitely start at 0')
-
-        if re.search(
-            r'(?i)^arrays start at 1',
-            msg.content
-        ):
-            await msg.channel.send('arrays do not start at 1, they start at 0')
-
-        if re.search(
-            r'(?i)^felix meow',
-            msg.content
-        ):
-            await msg.channel.send('ฅ^•ﻌ•^ฅ')
-
-        if re.search(
-            r'(?i)^felix what(?:\'s| is) the answer to life,? the universe and everything',
-            msg.content
-        ):
-            await msg.channel.send('42')
-
-        if match := self.re_convert.search(msg.content):
-            unit_aliases = {
-                'mile': 'miles',
-                'kilometer': 'km',
-                'kilometers': 'km',
-                'kilometre': 'km',
-                'kilometres': 'km',
-                'f': '°f',
-                'fahrenheit': '°f',
-                '°fahrenheit': '°f',
-                'c': '°c',
-                'celsius': '°c',
-                '°celsius': '°c',
-                'feet': 'ft',
-                'ounce': 'ounces',
-                'inch': 'inches',
-                'centimeters': 'cm',
-                'centimetres': 'cm',
-                'squaremeter': 'm²',
-                'squaremetre': 'm²',
-                'sqm': 'm²',
-                'squarefoot': 'ft²',
-                'squarefeet': 'ft²',
-                'sqft': 'ft²',
-            }
-            conversions = {
-                'miles': (lambda x: x*1.609344, 'km'),
-                'km': (lambda x: x*0.6213712, 'miles'),
-                '°f': (lambda x: (x-32)/1.8, '°C'),
-                '°c': (lambda x: x*1.8+32, '°F'),
-                'lb': (lambda x: x*0.4535924, 'kg'),
-                'kg': (lambda x: x*2.204623, 'lb'),
-                'ft': (lambda x: x*0.3048, 'm'),
-                'yards': (lambda x: x*0.3048*3, 'm'),
-                'ounces': (lambda x: x*28.35, 'g'),
-                'inches': (lambda x: x*2.54, 'cm'),
-                'cm': (lambda x: x*0.3937, 'inches'),
-                'm²': (lambda x: x*10.764, 'ft²'),
-                'ft²': (lambda x: x*0.09290304, 'm²'),
-            }
+        if match := RE_CONVERT.search(view.content):
             n, unit = match.groups()
-            if unit.lower() not in unit_aliases | conversions:
+            unit = UNIT_ALIASES.get(unit.lower(), unit)
+            if unit.lower() not in CONVERSIONS:
                 return
-            unit = unit_aliases.get(unit.lower(), unit)
             n = float(n)
-            converter, new = conversions[unit.lower()]
+            converter, new = CONVERSIONS[unit.lower()]
             await msg.channel.send(f'{round(n, 2)} {unit} = {round(converter(n), 2)} {new}')
 
     # ----------------------------------------------
@@ -845,6 +840,12 @@ class General(commands.Cog, name='General'):
 
             await ctx.send(embed=embed)
 
+    async def generate_qr_code(self, data, level, output, pixel_size=None):
+        try:
+            return await self.qr_service.generate(data, level, output, pixel_size)
+        except (ValueError, QueueFull) as e:
+            raise commands.BadArgument(str(e))
+
     @commands.group(
         name='qrcode',
         aliases=['qr'],
@@ -872,13 +873,21 @@ class General(commands.Cog, name='General'):
         pixel_size = max(1, min(pixel_size, 50))
         level = max(0, min(level, 3))
         await ctx.typing()
-        try:
-            pic_bytes = generate_qr_code(data, level, output='png',
-                                     png_pixel_size=pixel_size, verbose=False)
-        except ValueError as e:
-            raise commands.BadArgument(str(e))
-        pic_bytes.seek(0)
-        await ctx.send(file=File(pic_bytes, filename='qr.png'))
+        pic_bytes = await self.generate_qr_code(data, level, 'png', pixel_size)
+        await ctx.send(file=File(BytesIO(pic_bytes), filename='qr.png'))
+
+    async def send_text_qr_code(self, ctx, data, level, output):
+        if level is None:
+            level = 0
+        # Clamp values
+        level = max(0, min(level, 3))
+        res = await self.generate_qr_code(data, level, output)
+        if len(res) > 1990:
+            raise commands.BadArgument(
+                'Text-QR Code too big for discord. Use png mode, a smaller mode '
+                '(small, quad, braille), less data or lower error correction'
+            )
+        await ctx.send('```\n' + res + '\n```')
 
     @qrcode.command(
         name='text',
@@ -887,27 +896,15 @@ class General(commands.Cog, name='General'):
     async def qrtext(self, ctx, level: typing.Optional[int] = 0, *, data):
         """Print a text QR Code - Character-size: auto
 
+        The biggest character-size that fits into a message is used
+
         Error Correction levels:
         0 : L
         1 : M
         2 : Q
         3 : H
         """
-        if level is None:
-            level = 0
-        # Clamp values
-        level = max(0, min(level, 3))
-        try:
-            big_str, small_str = generate_qr_code(data, level, output='text', verbose=False)
-        except ValueError as e:
-            raise commands.BadArgument(str(e))
-        res = (big_str if len(big_str) <= 1990 else small_str)
-        if len(res) > 1990:
-            raise commands.BadArgument(
-                'Text-QR Code too big for discord. '
-                'Use png mode, less data or lower error correction'
-            )
-        await ctx.send('```\n' + res + '\n```')
+        await self.send_text_qr_code(ctx, data, level, 'text')
 
     @qrcode.command(
         name='big',
@@ -922,20 +919,7 @@ class General(commands.Cog, name='General'):
         2 : Q
         3 : H
         """
-        if level is None:
-            level = 0
-        # Clamp values
-        level = max(0, min(level, 3))
-        try:
-            res = generate_qr_code(data, level, output='full_str', verbose=False)
-        except ValueError as e:
-            raise commands.BadArgument(str(e))
-        if len(res) > 1990:
-            raise commands.BadArgument(
-                'Text-QR Code too big for discord. Use png mode, '
-                'small mode, less data or lower error correction'
-            )
-        await ctx.send('```\n' + res + '\n```')
+        await self.send_text_qr_code(ctx, data, level, 'full_str')
 
     @qrcode.command(
         name='small',
@@ -950,20 +934,64 @@ class General(commands.Cog, name='General'):
         2 : Q
         3 : H
         """
-        if level is None:
-            level = 0
-        # Clamp values
-        level = max(0, min(level, 3))
+        await self.send_text_qr_code(ctx, data, level, 'half_str')
+
+    @qrcode.command(
+        name='quad',
+        aliases=['q'],
+    )
+    async def qrquad(self, ctx, level: typing.Optional[int] = 0, *, data):
+        """Print a text QR Code - Character-size: 2x2 modules per character
+
+        Error Correction levels:
+        0 : L
+        1 : M
+        2 : Q
+        3 : H
+        """
+        await self.send_text_qr_code(ctx, data, level, 'quadrant_str')
+
+    @qrcode.command(
+        name='braille',
+        aliases=['br'],
+    )
+    async def qrbraille(self, ctx, level: typing.Optional[int] = 0, *, data):
+        """Print a text QR Code - Character-size: 2x4 modules per character (braille dots)
+
+        Error Correction levels:
+        0 : L
+        1 : M
+        2 : Q
+        3 : H
+        """
+        await self.send_text_qr_code(ctx, data, level, 'braille_str')
+
+    @qrcode.command(
+        name='decode',
+        aliases=['d'],
+    )
+    async def qrdecode(self, ctx):
+        """Decode the QR Code in the attached image
+
+        Only clean, unrotated images are supported (e.g. the QR Codes created by this bot)
+        """
+        if not ctx.message.attachments:
+            raise commands.BadArgument('Attach an image of a QR Code')
+        attachment = ctx.message.attachments[0]
+        if attachment.size > MAX_QR_IMAGE_SIZE:
+            raise commands.BadArgument('The image is too big')
+        await ctx.typing()
+        image_bytes = await attachment.read()
         try:
-            res = generate_qr_code(data, level, output='half_str', verbose=False)
-        except ValueError as e:
+            data = await self.qr_service.decode(image_bytes)
+        except (QRDecodeError, QueueFull) as e:
             raise commands.BadArgument(str(e))
-        if len(res) > 1990:
-            raise commands.BadArgument(
-                'Text-QR Code too big for discord. '
-                'Use png mode, less data or lower error correction'
-            )
-        await ctx.send('```\n' + res + '\n```')
+        # It's in an embed to prevent mentions from working
+        await ctx.send(embed=Embed(
+            title='QR Code',
+            description=discord.utils.escape_markdown(data)[:4096],
+        ))
+
 
 
 async def setup(client):
@@ -15,12 +15,18 @@ Commands:
 Only users that have an admin role can use the commands.
 """
 
-import json
 import time
 from collections import deque
 from dataclasses import dataclass, field
 from discord.ext import commands, tasks
-from discord import Member, DMChannel, Embed, NotFound, VerificationLevel
+from discord import Member, Embed, NotFound, VerificationLevel
+from db.batch import batch_writer
+from db.config import async_session
+from db.migrate import init_database, wait_until_ready
+from db.models.dals import JailDAL
+from db.models.jail import JailEvent
+from tools.rate_limiter import RateLimiter
+from tools.ttl_map import TTLMap
 #pylint: disable=E1101
 
 
@@ -29,12 +35,16 @@ from discord import Member, DMChannel, Embed, NotFound, VerificationLevel
 SPAM_NUM_MSG = 7  # Messages
 # Within
 SPAM_TIME = 10  # Seconds
+# These are the defaults, they can be changed for the whole server and for single guilds
+# or channels in the "rate_limits" section of config.json
 # If a user receives a second warning within
 SPAM_NAUGHTY_DURATION = 900  # Seconds
 # he will be permanently jailed
-# The task that clears the history and removes users from the "watchlist" if
-# they have been on it for more than SPAM_NAUGHTY_DURATION will run every
+# The task that drops expired users from the "watchlist" and idle rate limit entries
+# will run every
 SPAM_NAUGHTY_CHECK_INTERVAL = 300  # seconds
+# Jailed users can accept the condition of an unjail command for
+ACCEPTANCE_DURATION = 7 * 24 * 3600  # Seconds
 # Staff will recieve a warning if more than
 FLOOD_JOIN_NUM = 10  # Users join
 # Within
@@ -59,19 +69,25 @@ class Jail(commands.Cog, name='Jail'):
         self.JAIL_CHANNEL_ID = self.client.config['jail_channel']
         self.REPORT_ROLE = self.client.config['report_role']
         self.TEAM_ROLE = self.client.config['team_role']
-        # Dict to store offenders
-        self.naughty = {}
-        # Dict to store the timestamps of each users last 10 messages
-        self.history = {}
+        # member id -> None, warned members are jailed on the next offense
+        self.naughty = TTLMap(SPAM_NAUGHTY_DURATION, name='Jail naughty')
+        # Message rate limiters by (messages, seconds), see get_rate_limiter
+        self.rate_limiters = {}
+        self.load_rate_limits()
         self.member_history = deque(
             [(time.time() - FLOOD_JOIN_TIME, None)] * FLOOD_JOIN_NUM,
             FLOOD_JOIN_NUM
         )
         self.suspected_flooders = set()
         # Task that will remove users from the naughty list if they behaved for
-        # 15 minutes - will also clear self.history to not let it get too big
+        # 15 minutes
         self.clear_naughty_list.start()
-        self.acceptance_pending = dict()
+        # message id -> PendingAcceptance
+        self.acceptance_pending = TTLMap(ACCEPTANCE_DURATION, name='Jail acceptance')
+        self.init_database.start()
+        # Runs before the stages that delete messages, so every message counts for the rate
+        # limits (the stage never consumes a message)
+        self.client.pipeline.register('Jail', self.inspect_message, order=10)
 
     async def cog_check(self, ctx):
         return self.client.user_is_admin(ctx.author)
@@ -111,21 +127,53 @@ class Jail(commands.Cog, name='Jail'):
         )
         self.client.flood_mode = False
 
-    def load_state(self):
-        with open("../state.json", "r") as statefile:
-            return json.load(statefile)
+    def load_rate_limits(self):
+        """Read the message rate limits from the config
 
-    def load_perma_jail(self):
-        state = self.load_state()
-        return state.get('jailed', [])
-
-    def save_perma_jail(self, perma_jail):
-        state = self.load_state()
-        state['jailed'] = perma_jail
-        with open("../state.json", "w") as statefile:
-            return json.dump(state, statefile, indent=1)
-
-    async def send_to_jail(self, member, reason=None, permanent=True):
+        "rate_limits": {
+            "messages": 7, "seconds": 10,
+            "guilds": {"<guild id>": {"messages": 7, "seconds": 10}},
+            "channels": {"<channel id>": {"messages": 15, "seconds": 10}}
+        }
+        """
+        self.rate_limit_config = self.client.config
+        config = self.rate_limit_config.get('rate_limits', {})
+
+        def threshold(entry, default):
+            return (entry.get('messages', default[0]), entry.get('seconds', default[1]))
+
+        self.default_rate_limit = threshold(config, (SPAM_NUM_MSG, SPAM_TIME))
+        self.guild_rate_limits = {
+            int(guild_id): threshold(entry, self.default_rate_limit)
+            for guild_id, entry in config.get('guilds', {}).items()
+        }
+        self.channel_rate_limits = {
+            int(channel_id): threshold(entry, self.default_rate_limit)
+            for channel_id, entry in config.get('channels', {}).items()
+        }
+
+    def get_rate_limiter(self, channel):
+        """Return the rate limiter for messages in channel
+
+        Channels (and guilds) with the same thresholds share a rate limiter, so messages
+        of a member in all of them count together.
+        """
+        if self.client.config is not self.rate_limit_config:
+            # The config was reloaded
+            self.load_rate_limits()
+        threshold = self.channel_rate_limits.get(channel.id)
+        if threshold is None:
+            threshold = self.guild_rate_limits.get(channel.guild.id, self.default_rate_limit)
+        limiter = self.rate_limiters.get(threshold)
+        if limiter is None:
+            limiter = self.rate_limiters[threshold] = RateLimiter(*threshold)
+        return limiter
+
+    def add_jail_event(self, member, event, reason=None):
+        """Queue a moderation event for the jail history"""
+        batch_writer.add(JailEvent(member=member.id, kind=event, reason=reason))
+
+    async def send_to_jail(self, member, reason=None, permanent=True, event='jail'):
         """Jail a user
 
         Arguments:
@@ -134,8 +182,10 @@ class Jail(commands.Cog, name='Jail'):
         Keyword Arguments:
             reason {string} -- The Reason that will show in the
                                Audit Log (default: {None})
-            permanent {bool} -- Add the users id to the
-                                state.json (default: {True})
+            permanent {bool} -- Add the user to the perma jail
+                                table (default: {True})
+            event {string} -- The kind of event that is stored in
+                              the jail history (default: {'jail'})
 
         Returns:
             str -- Status message
@@ -147,13 +197,13 @@ class Jail(commands.Cog, name='Jail'):
             await member.add_roles(*jail_roles, reason=reason)
         except NotFound:
             status = f'{member} not in guild'
-        if permanent:
-            perma_jail = self.load_perma_jail()
-            if member.id not in perma_jail:
-                perma_jail.append(member.id)
-                self.save_perma_jail(perma_jail)
-            else:
-                status = f'{member} is already jailed'
+        await wait_until_ready()
+        async with async_session() as db:
+            async with db.begin():
+                jd = JailDAL(db)
+                if permanent and not await jd.add_jailed(member.id, reason=reason):
+                    status = f'{member} is already jailed'
+                await jd.add_event(member.id, event, reason=reason)
         return status
 
     async def release_from_jail(self, member):
@@ -166,15 +216,17 @@ class Jail(commands.Cog, name='Jail'):
             str -- Status message
         """
         status = f'{member} successfully released'
-        perma_jail = self.load_perma_jail()
         get_role = member.guild.get_role
         jail_roles = [get_role(x) for x in self.jail_roles if get_role(x)]
         await member.remove_roles(*jail_roles)
-        if member.id in perma_jail:
-            perma_jail.remove(member.id)
-            self.save_perma_jail(perma_jail)
-        else:
-            status = f'{member} is not in jail'
+        await wait_until_ready()
+        async with async_session() as db:
+            async with db.begin():
+                jd = JailDAL(db)
+                if await jd.remove_jailed(member.id):
+                    await jd.add_event(member.id, 'release')
+                else:
+                    status = f'{member} is not in jail'
         return status
 
     async def post_report(self, msg):
@@ -187,64 +239,56 @@ class Jail(commands.Cog, name='Jail'):
         return True
 
     # ----------------------------------------------
-    # Cog Event listeners
+    # Message stage
     # ----------------------------------------------
-    @commands.Cog.listener()
-    async def on_message(self, msg):
+    async def inspect_message(self, view):
+        msg = view.msg
         member = msg.author
-        if msg.author.bot:
-            # Dont run on any bot messages
-            return
-        if isinstance(msg.channel, DMChannel):
-            # Ignore DM
-            return
-        if self.client.user_is_admin(member):
+        if view.is_admin:
             # Dont jail friends on after adding a new spam link
             return
 
         now = time.time()
-        uid = str(member.id)
-        user_history = self.history.get(uid, deque())
-        # Add timestamp of current message to list of known timestamps of user
-        user_history.append(now)
-        if len(user_history) == SPAM_NUM_MSG:
-            # When we know enough message timestamps (SPAM_NUM_MSG)
-            # Pop the oldest message
-            oldest = user_history.popleft()
-            if now - oldest < SPAM_TIME:
-                # If the oldest message was sent less than SPAM_TIME seconds ago
-                if uid in self.naughty:
-                    # Jail the user permanently
-                    # If he is already on the naughty list
-                    await self.send_to_jail(member,
-                                            reason='Excessive messaging')
-                    await msg.channel.send("Aaaand it's gone")
-                    await self.post_report(msg)
-                else:
-                    # Warn the user and add him to the naughty list
-                    # If he is not on the naughty list yet
-                    await msg.channel.send(
-                        f'Hey {member.mention}, you are sending too many '
-                        + 'messages. This is a warning! If you keep '
-                        + 'this up you will be jailed.'
-                    )
-                    self.naughty[uid] = now
-                    # "Reset" his history so he doesn't get jailed immediately
-                    # on the 11th message
-                    user_history = deque()
-        # Save the users history again (the oldest message was popped)
-        self.history[uid] = user_history
-
+        rate_limiter = self.get_rate_limiter(msg.channel)
+        if rate_limiter.hit(member.id, now):
+            # The user sent more messages than allowed for this channel
+            # Forget the messages so they don't get jailed on the next one
+            rate_limiter.reset(member.id)
+            if member.id in self.naughty:
+                # Jail the user permanently
+                # If he is already on the naughty list
+                await self.send_to_jail(member,
+                                        reason='Excessive messaging',
+                                        event='auto_jail')
+                await msg.channel.send("Aaaand it's gone")
+                await self.post_report(msg)
+            else:
+                # Warn the user and add him to the naughty list
+                # If he is not on the naughty list yet
+                await msg.channel.send(
+                    f'Hey {member.mention}, you are sending too many '
+                    + 'messages. This is a warning! If you keep '
+                    + 'this up you will be jailed.'
+                )
+                self.naughty[member.id] = None
+                self.add_jail_event(member, 'warning', reason='Excessive messaging')
 
+    # ----------------------------------------------
+    # Cog Event listeners
+    # ----------------------------------------------
     @commands.Cog.listener()
     async def on_member_join(self, member):
         """Checks if a joining user is "perma-jailed"
         and jails him if needed
         """
-        perma_jail = self.load_perma_jail()
-        if member.id in perma_jail:
+        # The perma jail may not be imported from state.json yet
+        await wait_until_ready()
+        async with async_session() as db:
+            async with db.begin():
+                is_jailed = await JailDAL(db).is_jailed(member.id)
+        if is_jailed:
             await self.send_to_jail(
-                member, reason='User tried to rejoin', permanent=False
+                member, reason='User tried to rejoin', permanent=False, event='rejoin'
             )
 
         # Flood Protection
@@ -266,10 +310,10 @@ class Jail(commands.Cog, name='Jail'):
 
         msg = reaction.message
 
-        if msg.id not in self.acceptance_pending:
+        pending = self.acceptance_pending.get(msg.id)
+        if pending is None:
             return
 
-        pending = self.acceptance_pending[msg.id]
         if not user.id in pending.users:
             return
 
@@ -288,7 +332,7 @@ class Jail(commands.Cog, name='Jail'):
         pending.users.remove(user.id)
 
         if not pending.users:
-            del self.acceptance_pending[msg.id]
+            self.acceptance_pending.pop(msg.id)
 
 
     # ----------------------------------------------
@@ -414,16 +458,19 @@ class Jail(commands.Cog, name='Jail'):
     # ----------------------------------------------
     # Cog Tasks
     # ----------------------------------------------
+    @tasks.loop(count=1)
+    async def init_database(self):
+        imported = await init_database(self.client.state)
+        if imported:
+            print(f'Imported {imported} perma jailed members from state.json')
 
     @tasks.loop(seconds=SPAM_NAUGHTY_CHECK_INTERVAL)
     async def clear_naughty_list(self):
         now = time.time()
-        newdict = {}
-        for k, v in self.naughty.items():
-            if now - v < SPAM_NAUGHTY_DURATION:
-                newdict[k] = v
-        self.naughty = newdict
-        self.history = {}
+        self.naughty.expire()
+        # Drop the rate limit entries of members that stopped writing
+        for rate_limiter in self.rate_limiters.values():
+            rate_limiter.evict(now)
 
         if self.client.flood_mode:
             target = self.client.get_channel(self.REPORT_CHANNEL_ID)
@@ -432,8 +479,10 @@ class Jail(commands.Cog, name='Jail'):
                 'If the flood is over please run `felix flood clear`'
             )
 
-    def cog_unload(self):
+    async def cog_unload(self):
         self.clear_naughty_list.cancel()
+        self.client.pipeline.unregister('Jail')
+        await batch_writer.flush()
 
 
 async def setup(client):
@@ -3,21 +3,33 @@ It will auto delete messages that contain certain links.
 Discord invite link offenders will be informed 1 time every 10 minutes.
 patreon and gofundme links are silently deleted
 
+More domains and file types can be blocked in config.json (reloaded with the config):
+    "link_blocker": {"domains": ["example.com"], "filetypes": [".scr"]}
+Links to the domains of external block list feeds (see tools/blocklist.py) are deleted too:
+    "link_blocker": {"feeds": [{"name": "...", "source": "file or url", "refresh": 3600}]}
+
 Commands:
     allow           Specify a user. User is then allowed to post 1
                     discord.gg invite link
+    feeds           Show the loaded block list feeds and their memory usage
+    └ reload        Reload all feeds now
 
 Only users that have an admin role can use the commands.
 """
 
+import asyncio
 import re
-import time
 import random
-from dataclasses import dataclass
-from io import BytesIO
-from discord.ext import commands
+from dataclasses import dataclass, field
+from aiohttp import ClientError
+from discord.ext import commands, tasks
 from discord import Member, DMChannel, Embed, File
 from discord.abc import Messageable
+from tools.message_pipeline import MessageView, changed_span
+from tools.ttl_map import TTLMap
+from tools.attachment_scan import AttachmentScanner
+from tools.blocklist import FeedSet
+from tools.url_filter import UrlFilter
 
 FORBIDDEN = [
     'patreon.com',
@@ -25,6 +37,14 @@ FORBIDDEN = [
     'gofund.me'
 ]
 FORBIDDEN_FILETYPES = ('.exe',)
+# Seconds until a link offender is warned again
+NAUGHTY_LIST_TIME = 600
+# Seconds an allowance of the allow command is valid
+ALLOWED_ONCE_TIME = 24 * 3600
+# Seconds the verdict of an allowed message is kept, edits within that time are only
+# checked for the changed part of the content
+VERDICT_TIME = 3600
+DISCORD_INVITE_RE = re.compile(r'(?i)(discord(app)?\.(gg|io|me|co|com\/invite)\/\S+)')
 
 
 @dataclass
@@ -33,21 +53,66 @@ class MinimalMessage:
     author: Member
     channel: Messageable
     attachments: list
+    # (host, path) of the urls in content
+    links: list
+    # Why attachments were forbidden and the files for the report
+    reasons: list = field(default_factory=list)
+    report_files: list = field(default_factory=list)
 
 
 class LinkBlocker(commands.Cog, name='Link Blocker'):
     def __init__(self, client):
         self.client = client
-        self.allowed_once = []
-        self.naughty_list = {}
-        self.NAUGHTY_LIST_TIME = 600
+        # member id -> number of discord links the member may post
+        self.allowed_once = TTLMap(ALLOWED_ONCE_TIME, name='Link Blocker allowed')
+        # member id -> None, members that were warned
+        self.naughty_list = TTLMap(NAUGHTY_LIST_TIME, name='Link Blocker naughty')
+        # message id -> verdict of the content of the message that was allowed, see get_verdict
+        self.verdicts = TTLMap(VERDICT_TIME, name='Link Blocker verdicts')
         self.REPORT_CHANNEL = self.client.config['report_channel']
         self.REPORT_ROLE = self.client.config['report_role']
-        self.forbidden_files = []
+        self.attachment_scanner = AttachmentScanner(self.client.session)
+        self.feeds = FeedSet()
+        # Changes whenever load_filters runs, see get_verdict
+        self.filter_generation = 0
+        self.load_filters()
+        self.refresh_feeds.start()
+        # After Jail and Spam: messages that should get their author jailed must reach Spam
+        # before they are only deleted here
+        self.client.pipeline.register('Link Blocker', self.inspect_message, order=30, bots=True)
+
+    def cog_unload(self):
+        self.refresh_feeds.cancel()
+        self.client.pipeline.unregister('Link Blocker')
+
+    @tasks.loop(minutes=1)
+    async def refresh_feeds(self):
+        if self.client.config is not self.filter_config:
+            self.load_filters()
+        await self.feeds.refresh(self.client.session)
 
     async def cog_check(self, ctx):
         return self.client.user_is_admin(ctx.author)
 
+    def load_filters(self):
+        """Build the url filter from the built in lists and the lists in the config"""
+        self.filter_config = self.client.config
+        self.filter_generation += 1
+        config = self.filter_config.get('link_blocker', {})
+        self.url_filter = UrlFilter(
+            [*FORBIDDEN, *config.get('domains', [])],
+            [*FORBIDDEN_FILETYPES, *config.get('filetypes', [])],
+        )
+        self.feeds.configure(config.get('feeds', []))
+
+    def get_verdict(self, content):
+        """Return the key of an allowed content for self.verdicts
+
+        It includes the generations of the filters and feeds, so a verdict is not reused
+        after the blocked domains or file types changed
+        """
+        return (hash(content), self.filter_generation, self.feeds.generation)
+
     # ----------------------------------------------
     # Message checks
     # ----------------------------------------------
@@ -55,132 +120,163 @@ class LinkBlocker(commands.Cog, name='Link Blocker'):
         """return True if message is a DM"""
         return isinstance(msg.channel, DMChannel)
 
-    def is_allowed(self, msg):
+    def is_allowed(self, view):
         """return True if user is permitted to post links"""
-        if msg.author == self.client.user:
+        if view.msg.author == self.client.user:
             return True
-        if self.client.user_is_admin(msg.author):
+        if view.is_admin:
             return True
         return False
 
     async def has_discord_link(self, msg):
         """Check message and return True if a discord link was detected"""
-        if len(re.findall(r'(?i)(discord(app)?\.(gg|io|me|co|com\/invite)\/\S+)', msg.content)):
-            if msg.author.id in self.allowed_once:
-                self.allowed_once.remove(msg.author.id)
+        if DISCORD_INVITE_RE.search(msg.content):
+            allowed = self.allowed_once.pop(msg.author.id, 0)
+            if allowed:
+                if allowed > 1:
+                    self.allowed_once[msg.author.id] = allowed - 1
                 return False
             else:
-                if str(msg.author.id) in self.naughty_list:
-                    last_time = self.naughty_list[str(msg.author.id)]
-                    if time.time() - last_time > self.NAUGHTY_LIST_TIME:
-                        self.naughty_list.pop(str(msg.author.id))
-                    else:
-                        return True
+                if msg.author.id in self.naughty_list:
+                    return True
                 if not msg.author.bot:
                     await msg.channel.send(
                         f'Sorry {msg.author.mention}. ' +
                         'Posting links to other servers is not allowed.'
                     )
-                self.naughty_list[str(msg.author.id)] = time.time()
+                self.naughty_list[msg.author.id] = None
             return True
         return False
 
     async def has_forbidden_text(self, msg):
         """Check message and return True if forbidden text was detected"""
-        if len(re.findall(
-            r'(?i)(http(s)?\:\/\/(www\.)?(' +
-            '|'.join([s.replace('.', '\\.') for s in FORBIDDEN]) +
-            r'))\b',
-            msg.content
-        )):
-            return True
-        if len(re.findall(
-            r'(?i)(http(s)?\:\/\/(www\.)?[^\s]+(' +
-            '|'.join([s.replace('.', '\\.') for s in FORBIDDEN_FILETYPES]) +
-            r'))\b',
-            msg.content
-        )):
-            return True
-        return False
+        if not msg.links:
+            return False
+        return bool(self.url_filter.match(msg.links) or self.feeds.match(msg.links))
 
     async def has_forbidden_attachments(self, msg):
-        """Check message and return True if forbidden attachments were detected"""
-        attachments = msg.attachments
-        if not attachments:
+        """Check message and return True if forbidden attachments were detected
+
+        The reasons and the files for the report are stored in msg
+        """
+        if not msg.attachments:
             return False
-        forbidden = [
-            i for i in attachments if i.filename.endswith(FORBIDDEN_FILETYPES)
-        ]
-        if not forbidden:
+        findings = await self.attachment_scanner.scan(
+            msg.attachments, self.url_filter.match_filetype
+        )
+        if not findings:
             return False
-        size = sum(i.size for i in forbidden)
+        msg.reasons = [f'{i.attachment.filename}: {i.reason}' for i in findings]
         # Do not attach files if the maximum upload size is exceeded
-        if size <= 8_000_000:
-            self.forbidden_files = [
-                File(
-                    BytesIO(await i.read()),
-                    filename=i.filename
-                ) for i in forbidden
-            ]
+        if sum(i.attachment.size for i in findings) > 8_000_000:
+            for finding in findings:
+                if finding.fp is not None:
+                    finding.fp.close()
+            return True
+        for finding in findings:
+            fp = finding.fp
+            if fp is None:
+                try:
+                    fp = await self.attachment_scanner.download(finding.attachment)
+                except (ClientError, asyncio.TimeoutError):
+                    continue
+            msg.report_files.append(File(fp, filename=finding.attachment.filename))
         return True
 
-    async def post_report(self, msg):
-        """Post report of deletion to target channel"""
+    async def post_report(self, msg, result):
+        """Post report of deletion to target channel
+
+        result is the MinimalMessage returned by check_message
+        """
         target = self.client.get_channel(self.REPORT_CHANNEL)
         extra_content = {}
         if msg.content:
             e = Embed(description=msg.content,
                       color=random.randint(0, 0xFFFFFF))
             extra_content['embed'] = e
-        if self.forbidden_files:
-            extra_content['files'] = self.forbidden_files
-        await target.send(
-            f'<@&{self.REPORT_ROLE}> I deleted a message\n'
-            f'Message sent by {msg.author.mention} in {msg.channel.mention}',
-            **extra_content
-        )
-        if self.forbidden_files:
-            self.forbidden_files.clear()
+        if result.report_files:
+            extra_content['files'] = result.report_files
+        reasons = ''.join(f'\n{reason}' for reason in result.reasons)
+        try:
+            await target.send(
+                f'<@&{self.REPORT_ROLE}> I deleted a message\n'
+                f'Message sent by {msg.author.mention} in {msg.channel.mention}{reasons}',
+                **extra_content
+            )
+        finally:
+            close_files(result)
         return True
 
-    async def check_message(self, msg):
-        """Check message - return True if message contains forbidden text"""
+    async def check_message(self, view, scan_attachments=True):
+        """Check message - return a MinimalMessage if message contains forbidden text
+
+        Returns None if the message is allowed
+        """
         my_msg = MinimalMessage(
-            msg.content,
-            msg.author,
-            msg.channel,
-            msg.attachments
+            # spoiler tags are already removed from view.text
+            view.text,
+            view.msg.author,
+            view.msg.channel,
+            view.msg.attachments,
+            view.links,
         )
-        # ignore spoiler tags
-        my_msg.content = my_msg.content.replace('||', '')
         if self.is_dm(my_msg):
-            return False
-        if self.is_allowed(my_msg):
-            return False
+            return None
+        if self.is_allowed(view):
+            return None
+        if self.client.config is not self.filter_config:
+            self.load_filters()
         if await self.has_discord_link(my_msg):
-            return True
+            return my_msg
         if await self.has_forbidden_text(my_msg):
-            return True
-        if await self.has_forbidden_attachments(my_msg):
-            return True
-        return False
+            return my_msg
+        if scan_attachments and await self.has_forbidden_attachments(my_msg):
+            return my_msg
+        return None
 
     # ----------------------------------------------
-    # Event listeners
+    # Message stage and event listeners
     # ----------------------------------------------
-    @commands.Cog.listener()
-    async def on_message(self, msg):
-        if await self.check_message(msg):
-            await msg.delete()
-            if not msg.author.bot:
-                await self.post_report(msg)
+    async def inspect_message(self, view):
+        msg = view.msg
+        result = await self.check_message(view)
+        if result:
+            await self.delete_and_report(msg, result)
+            return True
+        self.verdicts[msg.id] = self.get_verdict(msg.content)
+        return False
 
     @commands.Cog.listener()
     async def on_message_edit(self, before, after):
-        if await self.check_message(after):
-            await after.delete()
-            if not after.author.bot:
-                await self.post_report(after)
+        # Attachments can only be removed by an edit
+        new_attachments = {i.id for i in after.attachments} - {i.id for i in before.attachments}
+        if before.content == after.content and not new_attachments:
+            # e.g. Discord resolved the embeds of the links
+            return
+        content = None
+        if self.client.config is not self.filter_config:
+            self.load_filters()
+        if self.verdicts.get(after.id) == self.get_verdict(before.content) and not new_attachments:
+            # Only the words that were changed can make the message forbidden
+            start, end = changed_span(before.content, after.content)
+            content = after.content[start:end]
+        view = MessageView.from_message(after, self.client, content=content)
+        result = await self.check_message(view, scan_attachments=content is None)
+        if result:
+            await self.delete_and_report(after, result)
+        else:
+            self.verdicts[after.id] = self.get_verdict(after.content)
+
+    async def delete_and_report(self, msg, result):
+        try:
+            await msg.delete()
+        except BaseException:
+            close_files(result)
+            raise
+        if msg.author.bot:
+            close_files(result)
+        else:
+            await self.post_report(msg, result)
 
     # ----------------------------------------------
     # Command to allow 1 discord.gg link
@@ -192,7 +288,36 @@ class LinkBlocker(commands.Cog, name='Link Blocker'):
     async def allow(self, ctx, member: Member):
         """Allow a single discord.gg link by @user"""
         await ctx.send(f'Hey {member.mention}, you can post 1 discord.gg link!')
-        self.allowed_once.append(member.id)
+        self.allowed_once[member.id] = self.allowed_once.get(member.id, 0) + 1
+
+    # ----------------------------------------------
+    # Block list feeds
+    # ----------------------------------------------
+    @commands.group(
+        name='feeds',
+        hidden=True,
+        invoke_without_command=True,
+    )
+    async def feeds_report(self, ctx):
+        """Show the loaded block list feeds"""
+        if not self.feeds:
+            await ctx.send('No block list feeds configured')
+            return
+        await ctx.send(f'```\n{self.feeds.report()}\n```')
+
+    @feeds_report.command(
+        name='reload',
+    )
+    async def feeds_reload(self, ctx):
+        """Reload all block list feeds"""
+        await self.feeds.refresh(self.client.session, force=True)
+        await ctx.send(f'```\n{self.feeds.report()}\n```')
+
+
+def close_files(result):
+    for file in result.report_files:
+        file.close()
+        file.fp.close()
 
 
 async def setup(client):
@@ -12,6 +12,9 @@ Commands:
 
     pull            pull latest changes from github (superuser only)
     error           print the traceback of the last unhandled error to chat
+    pipeline        show per stage timings of the message pipeline
+     ├reset             reset the timings
+     └maps              show the size and hit rates of the expiring maps
 
 Only users that have an admin role can use the commands.
 """
@@ -22,6 +25,7 @@ from datetime import datetime, timezone
 from os import path, listdir
 from discord import Activity, Embed, Member, Status
 from discord.ext import commands
+from tools.ttl_map import TTL_MAPS
 
 
 class Management(commands.Cog, name='Management'):
@@ -119,6 +123,7 @@ class Management(commands.Cog, name='Management'):
     def reload_config(self):
         with open("../config.json") as conffile:
             self.client.config = json.load(conffile)
+        self.client.reload_permissions()
 
     def crawl_cogs(self, directory='cogs'):
         cogs = []
@@ -337,6 +342,58 @@ class Management(commands.Cog, name='Management'):
             return
         await ctx.send('```css\n' + '\n'.join(result) + '\n```')
 
+    # ----------------------------------------------
+    # Function Group to show message pipeline timings
+    # ----------------------------------------------
+    @commands.group(
+        invoke_without_command=True,
+        name='pipeline',
+        hidden=True,
+    )
+    async def pipeline(self, ctx):
+        """Show the per stage timings of the message pipeline"""
+        stages = sorted(self.client.pipeline.stages, key=lambda x: x.total_time, reverse=True)
+        if not stages:
+            await ctx.send('No message stages registered')
+            return
+        l_max = max(len(stage.name) for stage in stages) + 1
+        response = [f'{"Stage".ljust(l_max)}   calls    avg µs    max ms   total s']
+        for stage in stages:
+            avg = stage.total_time / stage.calls * 1e6 if stage.calls else 0
+            response.append(
+                f'{stage.name.ljust(l_max)} {stage.calls:7} {avg:9.1f} '
+                f'{stage.max_time * 1e3:9.2f} {stage.total_time:9.2f}'
+            )
+        await ctx.send('```css\n' + '\n'.join(response) + '\n```')
+
+    @pipeline.command(
+        name='reset',
+        aliases=['clear'],
+    )
+    async def pipeline_reset(self, ctx):
+        """Reset the message pipeline timings"""
+        self.client.pipeline.reset_stats()
+        await ctx.send('`Pipeline timings reset`')
+
+    @pipeline.command(
+        name='maps',
+    )
+    async def pipeline_maps(self, ctx):
+        """Show the size and hit rates of the expiring maps"""
+        maps = sorted(TTL_MAPS.items())
+        if not maps:
+            await ctx.send('No expiring maps')
+            return
+        l_max = max(len(name) for name, _ in maps) + 1
+        response = [f'{"Map".ljust(l_max)} entries     hits   misses  expired  evicted']
+        for name, ttl_map in maps:
+            stats = ttl_map.stats
+            response.append(
+                f'{name.ljust(l_max)} {len(ttl_map):7} {stats.hits:8} {stats.misses:8} '
+                f'{stats.expired:8} {stats.evicted:8}'
+            )
+        await ctx.send('```css\n' + '\n'.join(response) + '\n```')
+
     @commands.group(
         invoke_without_command=True,
         name='error',
@@ -1,7 +1,5 @@
 import itertools
-import json
 from datetime import date, datetime, timedelta
-from pathlib import Path
 
 import discord
 from bs4 import BeautifulSoup
@@ -20,7 +18,6 @@ THREAD_URL = "https://mail.python.org/archives/list/{list}@python.org/thread/{id
 
 COLOURS = itertools.cycle((0xFFD241, 0x3775A8, 0xFFFFFE))
 
-STATE_JSON = Path("../state.json")
 STATE_KEY = "mailing_list"
 STATE_MSG_HASHES_KEY = "message_id_hash"
 
@@ -37,20 +34,13 @@ class PythonMailingList(Cog):
     async def cog_check(self, ctx):
         return self.client.user_is_admin(ctx.author)
 
-    @staticmethod
-    def write_mail_hash(message_id_hash):
-        state_json = json.loads(STATE_JSON.read_text())
-        if not state_json.get(STATE_MSG_HASHES_KEY):
-            state_json[STATE_MSG_HASHES_KEY] = {}
-        state_json[STATE_MSG_HASHES_KEY][message_id_hash] = datetime.now().timestamp()
+    def write_mail_hash(self, message_id_hash):
+        mails_sent = self.client.state.get(STATE_MSG_HASHES_KEY) or {}
+        mails_sent[message_id_hash] = datetime.now().timestamp()
+        self.client.state.set(STATE_MSG_HASHES_KEY, mails_sent)
 
-        with open(STATE_JSON, "w") as statefile:
-            json.dump(state_json, statefile, indent=1)
-
-    @staticmethod
-    def mail_exists(message_id_hash):
-        state_json = json.loads(STATE_JSON.read_text())
-        mails_sent = state_json.get(STATE_MSG_HASHES_KEY)
+    def mail_exists(self, message_id_hash):
+        mails_sent = self.client.state.get(STATE_MSG_HASHES_KEY)
 
         if not mails_sent:
             return False
@@ -79,14 +69,9 @@ class PythonMailingList(Cog):
             reason=f"Creating new thread for posting {maillist} mailing list.",
         )
 
-        state_json = json.loads(STATE_JSON.read_text())
-        if not state_json.get(STATE_KEY):
-            state_json[STATE_KEY] = {}
-
-        state_json[STATE_KEY][maillist] = thread.id
-
-        with open(STATE_JSON, "w") as statefile:
-            json.dump(state_json, statefile, indent=1)
+        mailing_lists = self.client.state.get(STATE_KEY) or {}
+        mailing_lists[maillist] = thread.id
+        self.client.state.set(STATE_KEY, mailing_lists)
 
         await ctx.send(
             f"✅ Successfully added {maillist}, listening to {thread.mention}."
@@ -95,8 +80,7 @@ class PythonMailingList(Cog):
     @loop(minutes=30)
     async def fetch_new_posts(self):
         # Clear the old message hashes from the state.json
-        state_json = json.loads(STATE_JSON.read_text())
-        mails_sent = state_json.get(STATE_MSG_HASHES_KEY)
+        mails_sent = self.client.state.get(STATE_MSG_HASHES_KEY)
 
         if not mails_sent:
             await self.post_maillist()
@@ -104,9 +88,8 @@ class PythonMailingList(Cog):
 
         for mail_hash, timestamp in mails_sent.copy().items():
             if (datetime.now() - datetime.fromtimestamp(timestamp)) > timedelta(days=7):
-                del state_json[STATE_MSG_HASHES_KEY][mail_hash]
-        with open(STATE_JSON, "w") as statefile:
-            json.dump(state_json, statefile, indent=1)
+                del mails_sent[mail_hash]
+        self.client.state.set(STATE_MSG_HASHES_KEY, mails_sent)
 
         await self.post_maillist()
 
@@ -125,8 +108,7 @@ class PythonMailingList(Cog):
             self.existing_messages[key] = []
 
     async def post_maillist(self):
-        state_json = json.loads(STATE_JSON.read_text())
-        mailing_lists = state_json.get(STATE_KEY)
+        mailing_lists = self.client.state.get(STATE_KEY)
 
         if not mailing_lists:
             return
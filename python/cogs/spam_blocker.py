@@ -9,6 +9,7 @@ Commands:
     ├ list      show list of all spam links as text dump
     ├ list 1    show list of spam links as paginated embed
     ├ remove    remove a spam link that automatically jails a user if posted
+    ├ feeds     show the loaded phishing domain feeds and their memory usage
     ├ test      test if string matches an existing rule
     ├ update    update/edit existing spam rule by rule id
     └ who       Show who created the rule
@@ -17,17 +18,26 @@ Commands:
     └ list      last 10 spam rule breakers in desc order
 
 Only users that have an admin role can use the commands.
+
+Posting a link to a domain of a phishing domain feed (see tools/blocklist.py) jails as well:
+    "spam": {"feeds": [{"name": "...", "source": "file or url", "refresh": 3600}]}
 """
 
-import re
-import json
 from io import BytesIO
 
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from db.batch import batch_writer
 from db.config import engine, Base, async_session
+from db.migrate import init_database, wait_until_ready
 from db.models.dals import SpamDAL, SpammerDAL
+from db.models.jail import PermaJail, JailEvent
+from db.models.spam import Spam, Spammer
+from tools.blocklist import FeedSet
+from tools.spam_matcher import SpamMatcher
 
 from discord.ext import commands, tasks
-from discord import DMChannel, Embed, NotFound, File
+from discord import Embed, NotFound, File
 
 
 class SpamBlocker(commands.Cog, name='Spam'):
@@ -38,25 +48,41 @@ class SpamBlocker(commands.Cog, name='Spam'):
         self.JAIL_CHANNEL_ID = self.client.config['jail_channel']
         self.REPORT_ROLE = self.client.config['report_role']
         self.TEAM_ROLE = self.client.config['team_role']
-        self.spam_dict = None
+        self.spam_matcher = None
+        self.feeds = FeedSet()
+        self.load_feeds()
         # init database and tables
         self.init_database.start()
         self.construct_spam_dict.start()
+        self.refresh_feeds.start()
+        self.client.pipeline.register('Spam', self.inspect_message, order=20)
+
+    async def cog_unload(self):
+        self.refresh_feeds.cancel()
+        self.client.pipeline.unregister('Spam')
+        await batch_writer.flush()
 
 
     @tasks.loop(count=1)
     async def init_database(self):
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
+        await init_database(self.client.state)
 
 
     @tasks.loop(count=1, reconnect=True)
     async def construct_spam_dict(self):
+        await wait_until_ready()
         async with async_session() as db:
             async with db.begin():
                 scd = SpamDAL(db)
                 rows = await scd.get_all_spam()
-            self.spam_dict = {rule.regex: re.compile(rule.regex, re.I) for rule in rows}
+            self.spam_matcher = SpamMatcher((rule.id, rule.regex) for rule in rows)
+
+
+    @tasks.loop(minutes=1)
+    async def refresh_feeds(self):
+        if self.client.config is not self.feeds_config:
+            self.load_feeds()
+        await self.feeds.refresh(self.client.session)
 
 
     async def cog_check(self, ctx):
@@ -65,24 +91,14 @@ class SpamBlocker(commands.Cog, name='Spam'):
     # ----------------------------------------------
     # Helper Functions
     # ----------------------------------------------
+    def load_feeds(self):
+        self.feeds_config = self.client.config
+        self.feeds.configure(self.feeds_config.get('spam', {}).get('feeds', []))
+
     def reload_spam_dict(self):
         self.construct_spam_dict.stop()
         self.construct_spam_dict.start()
 
-    def load_state(self):
-        with open("../state.json", "r") as statefile:
-            return json.load(statefile)
-
-    def load_perma_jail(self):
-        state = self.load_state()
-        return state.get('jailed', [])
-
-    def save_perma_jail(self, perma_jail):
-        state = self.load_state()
-        state['jailed'] = perma_jail
-        with open("../state.json", "w") as statefile:
-            return json.dump(state, statefile, indent=1)
-
     async def send_to_jail(self, member, reason=None, permanent=True):
         """Jail a user
 
@@ -92,8 +108,11 @@ class SpamBlocker(commands.Cog, name='Spam'):
         Keyword Arguments:
             reason {string} -- The Reason that will show in the
                                Audit Log (default: {None})
-            permanent {bool} -- Add the users id to the
-                                state.json (default: {True})
+            permanent {bool} -- Add the user to the perma jail
+                                table (default: {True})
+
+        The perma jail row is written right away in its own transaction, it keeps the
+        member jailed when they rejoin. The history row is written by the batch writer.
 
         Returns:
             str -- Status message
@@ -106,20 +125,23 @@ class SpamBlocker(commands.Cog, name='Spam'):
         except NotFound:
             status = f'{member} not in guild'
         if permanent:
-            perma_jail = self.load_perma_jail()
-            if member.id not in perma_jail:
-                perma_jail.append(member.id)
-                self.save_perma_jail(perma_jail)
-            else:
-                status = f'{member} is already jailed'
+            await wait_until_ready()
+            async with async_session() as db:
+                async with db.begin():
+                    await db.execute(
+                        sqlite_insert(PermaJail)
+                        .values(member=member.id, reason=reason)
+                        .on_conflict_do_nothing(index_elements=['member'])
+                    )
+            batch_writer.add(JailEvent(member=member.id, kind='spam_jail', reason=reason))
         return status
 
-    async def post_spam_report(self, msg, matched_line):
+    async def post_spam_report(self, msg, reason):
         """Post spam report of auto jailing to report channel"""
         target = self.client.get_channel(self.REPORT_CHANNEL_ID)
         embed = Embed(
             title='Phishing Link Detected!',
-            description=f'{msg.content}\nRule: `{matched_line}`',
+            description=f'{msg.content}\n{reason}',
             color=0xFFFFFF
         )
         await target.send(
@@ -130,32 +152,32 @@ class SpamBlocker(commands.Cog, name='Spam'):
         return True
 
     # ----------------------------------------------
-    # Cog Event listeners
+    # Message stage
     # ----------------------------------------------
-    @commands.Cog.listener()
-    async def on_message(self, msg):
+    async def inspect_message(self, view):
+        msg = view.msg
         member = msg.author
-        if msg.author.bot:
-            # Dont run on any bot messages
-            return
-        if isinstance(msg.channel, DMChannel):
-            # Ignore DM
-            return
-        if self.client.user_is_admin(member):
+        if view.is_admin:
             # Dont jail friends on after adding a new spam link
-            return
-
-        if self.spam_dict and msg.channel.id != self.JAIL_CHANNEL_ID:
-            for regex_string, regex in self.spam_dict.items():
-                if regex.findall(msg.content):
-                    await self.send_to_jail(member, reason='Sent illegal spam')
-                    await self.post_spam_report(msg, regex_string)
-                    async with async_session() as db:
-                        async with db.begin():
-                            scd = SpammerDAL(db)
-                            await scd.add_spammer(member=member.id, regex=regex_string)
-                    await msg.delete()
-                    break
+            return False
+
+        if msg.channel.id == self.JAIL_CHANNEL_ID:
+            return False
+        rule = self.spam_matcher.match(msg.content) if self.spam_matcher else None
+        if rule:
+            reason, regex = f'Rule {rule.id}: `{rule.regex}`', rule.regex
+        else:
+            blocked = self.feeds.match(view.links) if view.links else None
+            if not blocked:
+                return False
+            feed, domain = blocked
+            reason, regex = f'Feed {feed.name}: `{domain}`', f'{feed.name}: {domain}'
+        # Deleted first, jailing may have to wait for the database
+        await msg.delete()
+        await self.send_to_jail(member, reason='Sent illegal spam')
+        await self.post_spam_report(msg, reason)
+        batch_writer.add(Spammer(member=member.id, regex=regex))
+        return True
 
 
     # ----------------------------------------------
@@ -175,11 +197,12 @@ class SpamBlocker(commands.Cog, name='Spam'):
         name='reset'
     )
     async def rebuild_spam_db(self, ctx):
-        """WARNING!!! this will drop all tables and recreate them"""
+        """WARNING!!! this will drop all spam tables and recreate them"""
+        spam_tables = [Spam.__table__, Spammer.__table__]
         async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.drop_all)
-            await conn.run_sync(Base.metadata.create_all)
-            self.spam_dict = None
+            await conn.run_sync(Base.metadata.drop_all, tables=spam_tables)
+            await conn.run_sync(Base.metadata.create_all, tables=spam_tables)
+            self.spam_matcher = None
         await ctx.send(f'```✅ Spam Database reinitialized!```')
 
 
@@ -201,7 +224,7 @@ class SpamBlocker(commands.Cog, name='Spam'):
                     return
                 # commit new spam rule and return updated rule set
                 rows = await scd.add_spam(member.id, regex)
-                self.spam_dict = {rule.regex:re.compile(rule.regex, re.I) for rule in rows}
+                self.spam_matcher = SpamMatcher((rule.id, rule.regex) for rule in rows)
 
                 embed = Embed(
                     color=0x13DC51,
@@ -331,6 +354,19 @@ class SpamBlocker(commands.Cog, name='Spam'):
             await ctx.send(embed=embed)
 
 
+    @spam.command(
+        name='feeds',
+    )
+    async def spam_feeds(self, ctx, action=None):
+        """Show the phishing domain feeds, `spam feeds reload` reloads them now"""
+        if not self.feeds:
+            await ctx.send('No phishing domain feeds configured')
+            return
+        if action == 'reload':
+            await self.feeds.refresh(self.client.session, force=True)
+        await ctx.send(f'```\n{self.feeds.report()}\n```')
+
+
     @spam.command(
         name="test",
         aliases=["t", "teststring"]
@@ -339,20 +375,7 @@ class SpamBlocker(commands.Cog, name='Spam'):
         """Test a string and see what rules it matches"""
         member = ctx.message.author
         test_string = ' '.join((x for x in args))
-        matches = []
-        spam_id = None
-        async with async_session() as db:
-            async with db.begin():
-                scd = SpamDAL(db)
-                all_spam = await scd.get_all_spam()
-
-        for regex_string, regex in self.spam_dict.items():
-            if regex.findall(test_string):
-                for spam in all_spam:
-                    if spam.regex == regex_string:
-                        spam_id = spam.id
-                matches.append({'str': regex_string, 'id': spam_id})
-            spam_id = None
+        matches = self.spam_matcher.match_all(test_string) if self.spam_matcher else []
 
         if len(matches) == 0:
             await ctx.send(f"Hey {member.name}, No rule matches for: `{test_string}`")
@@ -360,7 +383,7 @@ class SpamBlocker(commands.Cog, name='Spam'):
 
         msg = f"""```\nMatches {len(matches)} rule{'s' if len(matches) > 1 else ''}: """
         for match in matches[:10]:
-            msg += f"\n {match.get('id'):4} | {match.get('str')}"
+            msg += f"\n {match.id:4} | {match.regex}"
         msg += "\n```"
         await ctx.send(msg)
 
@@ -98,6 +98,7 @@ class Superuser(commands.Cog, name='Superuser'):
 
         with open("../config.json", 'w') as conffile:
             json.dump(self.client.config, conffile, indent=1)
+        self.client.reload_permissions()
 
         await ctx.send('`Success`')
 
@@ -0,0 +1,71 @@
+"""Batched writes for hot paths
+
+Rows that do not have to be visible right away (spam history, moderation events...) are
+queued with batch_writer.add() instead of opening a session per row. Everything that is
+queued within batch_interval seconds is written in a single transaction, so a raid of
+hundreds of spammers ends up as a handful of commits.
+
+A failed batch is dropped, so rows that must not get lost (e.g. the perma jail) have to be
+written directly in their own transaction.
+
+Call `await batch_writer.flush()` before shutting down to write the remaining rows.
+"""
+
+import asyncio
+import traceback
+
+from db.config import async_session, database_config
+
+# Flush right away once this many rows are queued
+MAX_BATCH = 500
+
+
+class BatchWriter:
+    def __init__(self, interval=database_config['batch_interval'], max_batch=MAX_BATCH):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.pending = []
+        self._flush_handle = None
+        self._lock = None
+
+    def add(self, item):
+        """Queue an ORM instance or an executable statement (insert, update...)"""
+        self.pending.append(item)
+        loop = asyncio.get_running_loop()
+        if len(self.pending) >= self.max_batch:
+            self._cancel_scheduled()
+            asyncio.ensure_future(self.flush())
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                self.interval, lambda: asyncio.ensure_future(self.flush())
+            )
+
+    def _cancel_scheduled(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+    async def flush(self):
+        """Write all queued rows in one transaction"""
+        self._cancel_scheduled()
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self.pending:
+                return
+            items, self.pending = self.pending, []
+            try:
+                async with async_session() as db:
+                    async with db.begin():
+                        for item in items:
+                            if hasattr(item, '__table__'):
+                                db.add(item)
+                            else:
+                                await db.execute(item)
+            except Exception:
+                # The rows are only history, dropping one batch beats retrying forever
+                print(f'Ignoring exception while writing a batch of {len(items)} rows')
+                traceback.print_exc()
+
+
+batch_writer = BatchWriter()
@@ -1,9 +1,61 @@
+import json
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 
 DATABASE_URL = 'sqlite+aiosqlite:///felix.sqlite'
 
-engine = create_async_engine(DATABASE_URL, future=True, echo=False)
+# Defaults for the "database" block in config.json
+DATABASE_DEFAULTS = {
+    # WAL lets readers run while a write is in progress, and with synchronous=NORMAL
+    # a commit does not fsync - only checkpoints do
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 64 * 1024 * 1024,
+    # Negative values are KiB instead of pages
+    'cache_size': -16000,
+    # Milliseconds to wait for a lock before raising "database is locked"
+    'busy_timeout': 5000,
+    'pool_size': 5,
+    'max_overflow': 5,
+    # Seconds between flushes of the batch writer (see db/batch.py)
+    'batch_interval': 1,
+}
+
+
+def load_database_config(path='../config.json'):
+    try:
+        with open(path) as conffile:
+            config = json.load(conffile).get('database', {})
+    except FileNotFoundError:
+        config = {}
+    return {**DATABASE_DEFAULTS, **config}
+
+
+database_config = load_database_config()
+
+# aiosqlite defaults to a NullPool for file databases, which opens a new connection
+# (and runs the pragmas) for every session
+engine = create_async_engine(
+    DATABASE_URL,
+    future=True,
+    echo=False,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=database_config['pool_size'],
+    max_overflow=database_config['max_overflow'],
+)
+
+
+@event.listens_for(engine.sync_engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in ('journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'busy_timeout'):
+        cursor.execute(f'PRAGMA {pragma}={database_config[pragma]}')
+    cursor.close()
+
+
 async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 Base = declarative_base()
@@ -0,0 +1,93 @@
+import asyncio
+
+from db.config import engine, Base, async_session
+from db.models.dals import JailDAL
+from db.models.spam import Spammer
+
+# Several cogs initialize the database on load - only let one of them create tables at a time
+_lock = None
+# init_database runs once, later calls (other cogs, cog reloads) wait for the first one
+_init_lock = None
+# Set once init_database finished or failed, see wait_until_ready
+_ready = None
+# Exception of the last failed init_database
+_error = None
+
+
+def _ready_event():
+    global _ready
+    if _ready is None:
+        _ready = asyncio.Event()
+    return _ready
+
+
+def _create_all(conn):
+    Base.metadata.create_all(conn)
+    # create_all skips tables that already exist, so indexes that were added to existing
+    # tables have to be created separately
+    for index in Spammer.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+async def create_tables():
+    """Create all tables and indexes that do not exist yet"""
+    global _lock
+    if _lock is None:
+        _lock = asyncio.Lock()
+    async with _lock:
+        async with engine.begin() as conn:
+            await conn.run_sync(_create_all)
+
+
+async def migrate_perma_jail(state):
+    """One-shot import of the perma jail list from state.json into the database
+
+    Returns the number of imported members.
+    """
+    jailed = state.get('jailed')
+    if jailed is None:
+        return 0
+    imported = 0
+    async with async_session() as db:
+        async with db.begin():
+            jd = JailDAL(db)
+            for member_id in jailed:
+                if await jd.add_jailed(member_id, reason='Imported from state.json'):
+                    imported += 1
+    # Only remove the list after the transaction was committed
+    state.pop('jailed')
+    return imported
+
+
+async def init_database(state):
+    """Create the tables and import the perma jail from state.json
+
+    Returns the number of imported members. Wakes up everyone in wait_until_ready, also
+    if it fails - the next call (e.g. after reloading the cog) tries again.
+    """
+    global _init_lock, _error
+    if _init_lock is None:
+        _init_lock = asyncio.Lock()
+    async with _init_lock:
+        if _ready_event().is_set() and _error is None:
+            return 0
+        try:
+            await create_tables()
+            imported = await migrate_perma_jail(state)
+        except Exception as e:
+            _error = e
+            _ready_event().set()
+            raise
+        _error = None
+        _ready_event().set()
+    return imported
+
+
+async def wait_until_ready():
+    """Wait until init_database finished - queries before that may miss tables or rows
+
+    Raises RuntimeError if init_database failed.
+    """
+    await _ready_event().wait()
+    if _error is not None:
+        raise RuntimeError('The database could not be initialized') from _error
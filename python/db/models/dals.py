@@ -1,8 +1,9 @@
-from sqlalchemy import update, delete
+from sqlalchemy import update, delete, func
 from sqlalchemy.future import select
 from sqlalchemy.orm import Session
 
 from db.models.spam import Spam, Spammer
+from db.models.jail import PermaJail, JailEvent
 
 
 class SpamDAL():
@@ -90,3 +91,52 @@ class SpammerDAL():
         """Remove spammer item by its id"""
         query = delete(Spammer).where(Spammer.id == id)
         await self.db_session.execute(query)
+
+
+class JailDAL():
+    def __init__(self, db_session: Session):
+        self.db_session = db_session
+
+    async def is_jailed(self, member: int):
+        """Return True if member is in the perma jail"""
+        query = await self.db_session.execute(
+            select(PermaJail.id).where(PermaJail.member == member)
+        )
+        return query.scalar() is not None
+
+    async def add_jailed(self, member: int, reason: str = None):
+        """Add member to the perma jail, return False if member was already jailed"""
+        if await self.is_jailed(member):
+            return False
+        self.db_session.add(PermaJail(member=member, reason=reason))
+        await self.db_session.flush()
+        return True
+
+    async def remove_jailed(self, member: int):
+        """Remove member from the perma jail, return False if member was not jailed"""
+        query = await self.db_session.execute(
+            delete(PermaJail).where(PermaJail.member == member)
+        )
+        return query.rowcount > 0
+
+    async def get_jailed_count(self):
+        """Return count of perma jailed members"""
+        query = await self.db_session.execute(
+            select(func.count(PermaJail.id))
+        )
+        return query.scalar()
+
+    async def add_event(self, member: int, kind: str, reason: str = None):
+        """Add a moderation event (warning, auto_jail ...) to the history"""
+        self.db_session.add(JailEvent(member=member, kind=kind, reason=reason))
+        await self.db_session.flush()
+
+    async def get_events(self, member: int, limit: int = 10):
+        """Return the latest moderation events of a member"""
+        query = await self.db_session.execute(
+            select(JailEvent)
+            .where(JailEvent.member == member)
+            .order_by(JailEvent.created_at.desc())
+            .limit(limit)
+        )
+        return query.scalars().all()
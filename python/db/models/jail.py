@@ -0,0 +1,23 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from db.config import Base
+
+
+class PermaJail(Base):
+    __tablename__ = 'perma_jail'
+    id = Column(Integer, primary_key=True)
+    member = Column(Integer, nullable=False, unique=True, index=True)
+    reason = Column(String)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class JailEvent(Base):
+    __tablename__ = 'jail_event'
+    id = Column(Integer, primary_key=True)
+    member = Column(Integer, nullable=False)
+    # warning, auto_jail, spam_jail, jail, rejoin, release
+    kind = Column(String, nullable=False)
+    reason = Column(String)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    __table_args__ = (
+        Index('ix_jail_event_member_created_at', 'member', 'created_at'),
+    )
@@ -11,5 +11,5 @@ class Spam(Base):
 class Spammer(Base):
     __tablename__ = 'spammer'
     id = Column(Integer, primary_key=True)
-    member = Column(String, nullable=False)
+    member = Column(String, nullable=False, index=True)
     regex = Column(String, nullable=False)
@@ -0,0 +1,199 @@
+"""Scan message attachments for executables
+
+An attachment is forbidden if its file name has a forbidden suffix, if its first bytes are
+the signature of an executable (e.g. a renamed .exe) or if it is a zip archive that contains
+a file with a forbidden suffix or an executable.
+
+Attachments that Discord recognized as images or videos (they have a width) are not
+downloaded. For all others only the first SNIFF_SIZE bytes are requested, archives up to
+MAX_ARCHIVE_SIZE are downloaded completely to list their files.
+
+The attachments of a message are scanned concurrently. All downloads share a semaphore and
+a budget for the bytes that are downloaded at the same time, and they are streamed into
+memory (up to SPOOL_SIZE bytes) or a temporary file instead of being read in one piece.
+"""
+
+import asyncio
+import tempfile
+import zipfile
+from dataclasses import dataclass
+from io import BytesIO
+from aiohttp import ClientError
+
+# Number of bytes at the start of a file that are checked for a signature
+SNIFF_SIZE = 64
+# Downloads of up to this size are kept in memory, larger ones in a temporary file
+SPOOL_SIZE = 1024 * 1024
+# Zip archives up to this size are downloaded to check the files in them
+MAX_ARCHIVE_SIZE = 8 * 1024 * 1024
+# Only the first files of an archive are checked for a signature
+MAX_ARCHIVE_MEMBERS = 200
+MAX_CONCURRENT_DOWNLOADS = 4
+# Maximum number of bytes of the downloads that are in progress at the same time
+DOWNLOAD_BUDGET = 16 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+EXECUTABLE_SIGNATURES = (
+    (b'MZ', 'Windows executable'),
+    (b'\x7fELF', 'ELF executable'),
+    (b'\xcf\xfa\xed\xfe', 'Mach-O executable'),
+    (b'\xce\xfa\xed\xfe', 'Mach-O executable'),
+    (b'\xca\xfe\xba\xbe', 'Mach-O universal executable or Java class'),
+)
+ZIP_SIGNATURE = b'PK\x03\x04'
+
+
+@dataclass
+class Finding:
+    attachment: object
+    reason: str
+    # The complete content if it was downloaded for the scan
+    fp: object = None
+
+
+def sniff(head):
+    """Return the kind of executable that starts with head or None"""
+    for signature, kind in EXECUTABLE_SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    return None
+
+
+def scan_archive(fp, match_filetype):
+    """Return the reason why the zip archive in fp is forbidden or None - blocks"""
+    try:
+        with zipfile.ZipFile(fp) as archive:
+            infos = archive.infolist()
+            for info in infos:
+                if match_filetype(info.filename):
+                    return f'archive contains {info.filename}'
+            for info in infos[:MAX_ARCHIVE_MEMBERS]:
+                if info.is_dir() or info.flag_bits & 0x1:
+                    # Encrypted files can't be read
+                    continue
+                with archive.open(info) as member:
+                    kind = sniff(member.read(SNIFF_SIZE))
+                if kind:
+                    return f'archive contains {info.filename} ({kind})'
+    except (zipfile.BadZipFile, NotImplementedError, EOFError, OSError):
+        # Damaged archives or unsupported compression methods
+        return None
+    finally:
+        fp.seek(0)
+    return None
+
+
+class ByteBudget:
+    """Limits the number of bytes that are reserved at the same time"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.available = limit
+        # Futures of the acquire calls that wait for a release
+        self.waiters = []
+
+    async def acquire(self, size):
+        """Wait until size bytes are available and reserve them, returns the reserved size
+
+        Sizes above the limit reserve the whole budget
+        """
+        size = min(size, self.limit)
+        while self.available < size:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                self.waiters.remove(waiter)
+        self.available -= size
+        return size
+
+    def release(self, size):
+        self.available += size
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class AttachmentScanner:
+    def __init__(self, session, max_downloads=MAX_CONCURRENT_DOWNLOADS, budget=DOWNLOAD_BUDGET):
+        """
+        Arguments:
+            session {aiohttp.ClientSession} -- Session for the downloads
+
+        Keyword Arguments:
+            max_downloads {int} -- Maximum number of concurrent downloads
+            budget {int} -- Maximum number of bytes of all downloads in progress
+        """
+        self.session = session
+        self.semaphore = asyncio.Semaphore(max_downloads)
+        self.budget = ByteBudget(budget)
+
+    async def read_head(self, attachment):
+        """Return the first SNIFF_SIZE bytes of attachment"""
+        headers = {'Range': f'bytes=0-{SNIFF_SIZE - 1}'}
+        async with self.semaphore:
+            async with self.session.get(attachment.url, headers=headers) as response:
+                response.raise_for_status()
+                # The server may ignore the range and send the whole file
+                head = b''
+                while len(head) < SNIFF_SIZE:
+                    chunk = await response.content.read(SNIFF_SIZE - len(head))
+                    if not chunk:
+                        break
+                    head += chunk
+                return head
+
+    async def download(self, attachment):
+        """Return a file object with the content of attachment"""
+        fp = BytesIO() if attachment.size <= SPOOL_SIZE else tempfile.TemporaryFile()
+        reserved = await self.budget.acquire(attachment.size)
+        try:
+            async with self.semaphore:
+                async with self.session.get(attachment.url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        fp.write(chunk)
+        except BaseException:
+            fp.close()
+            raise
+        finally:
+            self.budget.release(reserved)
+        fp.seek(0)
+        return fp
+
+    async def scan_attachment(self, attachment, match_filetype):
+        """Return a Finding if attachment is forbidden or None"""
+        suffix = match_filetype(attachment.filename)
+        if suffix:
+            return Finding(attachment, f'file type {suffix}')
+        if attachment.width is not None:
+            # Discord could display it as an image or video
+            return None
+        try:
+            head = await self.read_head(attachment)
+            kind = sniff(head)
+            if kind:
+                return Finding(attachment, kind)
+            if head.startswith(ZIP_SIGNATURE) and attachment.size <= MAX_ARCHIVE_SIZE:
+                fp = await self.download(attachment)
+                reason = await asyncio.to_thread(scan_archive, fp, match_filetype)
+                if reason:
+                    return Finding(attachment, reason, fp)
+                fp.close()
+        except (ClientError, asyncio.TimeoutError):
+            # The attachment can't be checked, e.g. it was deleted already
+            pass
+        return None
+
+    async def scan(self, attachments, match_filetype):
+        """Return the Findings of the forbidden attachments
+
+        Arguments:
+            attachments {list} -- discord.Attachments
+            match_filetype {callable} -- Returns the forbidden suffix of a file name or None
+        """
+        results = await asyncio.gather(*(
+            self.scan_attachment(attachment, match_filetype) for attachment in attachments
+        ))
+        return [finding for finding in results if finding is not None]
@@ -0,0 +1,253 @@
+"""Domain block lists that are loaded from external feeds (e.g. phishing domain lists)
+
+A feed is a local file or an http(s) url with one domain per line. Comments (# or !), hosts
+file lines ("0.0.0.0 example.com") and urls are accepted as well.
+
+The domains of a feed are stored in a url_filter.DomainSet: a host is looked up by trying the
+host and each of its parent domains, so a lookup costs O(number of labels) no matter how many
+domains the feed has, and every subdomain of a blocked domain is blocked as well. A trie of
+the reversed labels and a sorted array of the reversed domains have the same complexity but
+are slower (and the trie is bigger) in CPython, see the benchmark.
+
+Feeds are rebuilt in a thread and swapped in when they are complete. Messages are checked
+against the old domains until then, and a feed whose content did not change is not rebuilt.
+
+Run `python -m tools.blocklist` from the python folder for a benchmark.
+"""
+
+import asyncio
+import hashlib
+import sys
+import time
+from dataclasses import dataclass, field
+from .url_filter import DomainSet
+
+
+def set_memory(domain_set):
+    """Return the approximate memory of a DomainSet in bytes"""
+    return sys.getsizeof(domain_set.domains) + sum(map(sys.getsizeof, domain_set.domains))
+
+
+def parse_feed(text):
+    """Yield the domains of a feed"""
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line or line.startswith('!'):
+            continue
+        # hosts file: "0.0.0.0 example.com", the domain is the last field
+        domain = line.split()[-1]
+        if '://' in domain:
+            domain = domain.split('://', 1)[1]
+        domain = domain.split('/', 1)[0].rsplit('@', 1)[-1].split(':', 1)[0]
+        if domain in ('localhost', '0.0.0.0', '127.0.0.1'):
+            continue
+        yield domain
+
+
+# ================================================================================================
+# Feeds
+# ================================================================================================
+
+@dataclass
+class Feed:
+    name: str
+    # File path or http(s) url
+    source: str
+    # Seconds between reloads, 0 to load the feed only once
+    refresh: int = 3600
+    domains: DomainSet = field(default_factory=DomainSet, repr=False)
+    digest: str = None
+    entries: int = 0
+    memory: int = 0
+    loaded_at: float = None
+    error: str = None
+
+    def is_due(self, now):
+        if self.loaded_at is None:
+            return True
+        return bool(self.refresh) and now - self.loaded_at >= self.refresh
+
+
+def build_domains(text):
+    """Return (DomainSet, memory) of the text of a feed - runs in a thread"""
+    domains = DomainSet(parse_feed(text))
+    return domains, set_memory(domains)
+
+
+class FeedSet:
+    def __init__(self, configs=()):
+        """
+        Keyword Arguments:
+            configs {list} -- [{"name": ..., "source": ..., "refresh": seconds}, ...]
+        """
+        self.feeds = {}
+        self.lock = asyncio.Lock()
+        # Changes whenever the blocked domains may have changed
+        self.generation = 0
+        self.configure(configs)
+
+    def configure(self, configs):
+        """Set the feeds, feeds whose source did not change keep their loaded domains"""
+        feeds = {}
+        for config in configs:
+            feed = self.feeds.get(config['name'])
+            if feed is None or feed.source != config['source']:
+                feed = Feed(config['name'], config['source'])
+            feed.refresh = config.get('refresh', feed.refresh)
+            feeds[feed.name] = feed
+        self.feeds = feeds
+        self.generation += 1
+
+    def __len__(self):
+        return len(self.feeds)
+
+    async def fetch(self, feed, session):
+        if feed.source.startswith(('http://', 'https://')):
+            async with session.get(feed.source) as response:
+                response.raise_for_status()
+                return await response.read()
+        return await asyncio.to_thread(_read_file, feed.source)
+
+    async def load(self, feed, session):
+        """Load feed and swap in the new domains, returns False if the feed did not change"""
+        data = await self.fetch(feed, session)
+        digest = hashlib.sha1(data).hexdigest()
+        changed = digest != feed.digest
+        if changed:
+            text = data.decode('utf-8', errors='replace')
+            feed.domains, feed.memory = await asyncio.to_thread(build_domains, text)
+            feed.entries = len(feed.domains)
+            feed.digest = digest
+            self.generation += 1
+        feed.loaded_at = time.time()
+        feed.error = None
+        return changed
+
+    async def refresh(self, session, force=False):
+        """Load all feeds that are due (or all feeds if force) one after the other
+
+        Errors are stored in feed.error, the feed keeps its old domains in that case
+        """
+        async with self.lock:
+            now = time.time()
+            for feed in list(self.feeds.values()):
+                if not (force or feed.is_due(now)):
+                    continue
+                try:
+                    await self.load(feed, session)
+                except Exception as e:
+                    feed.error = f'{type(e).__name__}: {e}'
+                    # Try again at the next refresh
+                    feed.loaded_at = now
+
+    def match(self, links):
+        """Return (feed, domain) of the first blocked host in links ((host, path) tuples)"""
+        for host, _ in links:
+            if not host:
+                continue
+            for feed in self.feeds.values():
+                domain = feed.domains.match(host)
+                if domain:
+                    return feed, domain
+        return None
+
+    def report(self):
+        """Return a text table of the feeds"""
+        lines = [f'{"feed":<16} {"domains":>8} {"memory":>10}  loaded (UTC)']
+        for feed in self.feeds.values():
+            loaded = time.strftime('%H:%M:%S', time.gmtime(feed.loaded_at)) \
+                if feed.loaded_at else 'never'
+            lines.append(
+                f'{feed.name[:16]:<16} {feed.entries:>8} {feed.memory // 1024:>7} KB  {loaded}'
+            )
+            if feed.error:
+                lines.append(f'  {feed.error}')
+        return '\n'.join(lines)
+
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+if __name__ == '__main__':
+    import random
+    import string
+    from bisect import bisect_right
+
+    random.seed(0)
+
+    def random_label():
+        return ''.join(random.choices(string.ascii_lowercase, k=random.randint(5, 12)))
+
+    def random_domain():
+        tld = random.choice(['com', 'net', 'org', 'io', 'xyz', 'ru', 'click'])
+        if random.random() < 0.3:
+            return f'{random_label()}.{random_label()}.{tld}'
+        return f'{random_label()}.{tld}'
+
+    domains = [random_domain() for _ in range(50000)]
+    text = '\n'.join(domains)
+    hosts = [
+        f'{random.choice(["", "cdn."])}{random.choice(domains)}' if random.random() < 0.5
+        else random_domain()
+        for _ in range(20000)
+    ]
+
+    def measure(name, build, match, memory):
+        start = time.perf_counter()
+        index = build()
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        blocked = sum(bool(match(index, host)) for host in hosts)
+        match_time = (time.perf_counter() - start) / len(hosts)
+        print(f'{name:<13} {match_time * 1e6:>7.2f} {build_time:>8.2f} '
+              f'{memory(index) / 1e6:>10.1f} {blocked:>8}')
+
+    # Trie of the reversed labels, True marks a blocked domain
+    def build_trie():
+        root = {}
+        for domain in parse_feed(text):
+            node = root
+            *parents, label = reversed(domain.lower().split('.'))
+            for parent in parents:
+                node = node.setdefault(sys.intern(parent), {})
+            node[sys.intern(label)] = True
+        return root
+
+    def trie_match(root, host):
+        node = root
+        for label in reversed(host.split('.')):
+            node = node.get(label)
+            if node is None or node is True:
+                return node
+        return None
+
+    def trie_memory(root):
+        memory, stack, labels = 0, [root], set()
+        while stack:
+            node = stack.pop()
+            memory += sys.getsizeof(node)
+            for label, child in node.items():
+                if id(label) not in labels:
+                    labels.add(id(label))
+                    memory += sys.getsizeof(label)
+                if child is not True:
+                    stack.append(child)
+        return memory
+
+    # Sorted array of the reversed domains with binary search
+    def array_match(array, host):
+        key = '.'.join(reversed(host.split('.')))
+        i = bisect_right(array, key)
+        return i and (key == array[i - 1] or key.startswith(array[i - 1] + '.'))
+
+    print(f'{len(domains)} domains, {len(hosts)} hosts')
+    print(f'{"":<13} {"µs/host":>7} {"build s":>8} {"memory MB":>10} {"blocked":>8}')
+    measure('suffix set', lambda: DomainSet(parse_feed(text)),
+            lambda index, host: index.match(host), set_memory)
+    measure('reversed trie', build_trie, trie_match, trie_memory)
+    measure('sorted array',
+            lambda: sorted('.'.join(reversed(d.lower().split('.'))) for d in parse_feed(text)),
+            array_match,
+            lambda array: sys.getsizeof(array) + sum(map(sys.getsizeof, array)))
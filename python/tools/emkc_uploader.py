@@ -0,0 +1,328 @@
+"""Background uploader for the EMKC chat log
+
+Messages are put on a queue and uploaded by a worker task, so the message pipeline
+never waits for the EMKC api. The worker takes up to batch_size queued messages at a
+time and posts them with at most `concurrency` requests in flight (the api accepts one
+chat per request, the session reuses its connections).
+
+Failed requests (connection errors, 5xx and 429) are retried with exponential backoff.
+Messages that still fail, or that don't fit into the queue during an outage, are appended
+to a spill file (one json object per line). The spill file is read back into the queue
+after the next successful upload and at startup, so an outage does not lose the log.
+On shutdown the queue, the overflow and the records of the batch that is being uploaded
+are spilled as well.
+
+Run `python -m tools.emkc_uploader check` from the python folder to check retries, spilling,
+replay and shutdown against a local stand-in server.
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+import traceback
+from dataclasses import dataclass
+
+from aiohttp import ClientError
+
+EMKC_CHAT_URL = 'https://emkc.org/api/internal/chats'
+SPILL_FILE = '../logs/emkc_spill.jsonl'
+# Messages per batch and concurrent requests per batch
+BATCH_SIZE = 20
+CONCURRENCY = 4
+# Messages that are kept in memory, everything else goes to the spill file
+MAX_QUEUE = 5000
+# Attempts per message and the backoff between them in seconds
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+# Seconds to keep uploading on shutdown before the rest is spilled
+CLOSE_TIMEOUT = 5
+
+
+@dataclass
+class UploadMetrics:
+    sent: int = 0
+    retried: int = 0
+    dropped: int = 0
+    spilled: int = 0
+    replayed: int = 0
+    # Seconds between queueing and uploading of the last uploaded message
+    last_lag: float = 0.0
+    max_lag: float = 0.0
+
+
+class EmkcUploader:
+    def __init__(self, session, headers, url=EMKC_CHAT_URL, spill_path=SPILL_FILE,
+                 batch_size=BATCH_SIZE, concurrency=CONCURRENCY, max_queue=MAX_QUEUE,
+                 backoff_base=BACKOFF_BASE):
+        self.session = session
+        self.headers = headers
+        self.url = url
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.backoff_base = backoff_base
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.queue = asyncio.Queue(max_queue)
+        self.metrics = UploadMetrics()
+        # Messages that did not fit into the queue, written by _spill_overflow
+        self.overflow = []
+        self._overflow_task = None
+        # Records of the current batch that were not uploaded yet
+        self.in_flight = []
+        self._spill_lock = asyncio.Lock()
+        self._task = None
+        self._busy = False
+
+    # ----------------------------------------------
+    # Public interface
+    # ----------------------------------------------
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def upload(self, data, queued_at=None):
+        """Queue a chat message (the form data for the api)"""
+        record = {'queued_at': queued_at or time.time(), 'data': data}
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.overflow.append(record)
+            if self._overflow_task is None or self._overflow_task.done():
+                self._overflow_task = asyncio.create_task(self._spill_overflow())
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    @property
+    def oldest_age(self):
+        """Age of the oldest queued message in seconds"""
+        if self.queue.empty():
+            return 0.0
+        # asyncio.Queue keeps its items in a deque
+        return time.time() - self.queue._queue[0]['queued_at']
+
+    async def close(self, timeout=CLOSE_TIMEOUT):
+        """Try to upload the queued messages for timeout seconds, spill everything that is left"""
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._drain(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        left, self.in_flight = self.in_flight, []
+        while not self.queue.empty():
+            left.append(self.queue.get_nowait())
+        await self._spill(left + self.overflow)
+        self.overflow = []
+
+    # ----------------------------------------------
+    # Worker
+    # ----------------------------------------------
+    async def _drain(self):
+        while not self.queue.empty() or self._busy:
+            await asyncio.sleep(0.1)
+
+    async def _run(self):
+        await self._replay()
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            self._busy = True
+            # Kept on self, so close() can spill the records if it cancels the upload
+            self.in_flight = batch
+            try:
+                results = await asyncio.gather(
+                    *(self._send(record) for record in batch), return_exceptions=True
+                )
+                for result in results:
+                    if isinstance(result, Exception):
+                        print('Ignoring exception in the EMKC uploader')
+                        traceback.print_exception(type(result), result, result.__traceback__)
+                if self.in_flight:
+                    await self._spill(self.in_flight)
+                    self.in_flight = []
+                elif os.path.exists(self.spill_path):
+                    # The api is reachable again, upload what was spilled during the outage
+                    await self._replay()
+            except Exception:
+                print('Ignoring exception in the EMKC uploader')
+                traceback.print_exc()
+                records, self.in_flight = self.in_flight, []
+                try:
+                    await self._spill(records)
+                except Exception:
+                    traceback.print_exc()
+            finally:
+                self._busy = False
+
+    async def _send(self, record):
+        """Upload a record, return False if it should be retried later"""
+        delay = self.backoff_base
+        for attempt in range(MAX_ATTEMPTS):
+            if attempt:
+                self.metrics.retried += 1
+                # Full jitter so concurrent requests don't retry in lockstep
+                await asyncio.sleep(random.uniform(0, delay))
+                delay = min(delay * 2, BACKOFF_MAX)
+            try:
+                async with self.semaphore:
+                    async with self.session.post(
+                        self.url, headers=self.headers, data=record['data']
+                    ) as response:
+                        status = response.status
+            except (ClientError, asyncio.TimeoutError):
+                continue
+            if status == 200:
+                self.in_flight.remove(record)
+                self.metrics.sent += 1
+                lag = time.time() - record['queued_at']
+                self.metrics.last_lag = lag
+                self.metrics.max_lag = max(self.metrics.max_lag, lag)
+                return True
+            if status < 500 and status != 429:
+                # Retrying won't change the answer
+                print(f'ERROR while sending chat log to EMKC. Response {status}')
+                self.in_flight.remove(record)
+                self.metrics.dropped += 1
+                return True
+        return False
+
+    # ----------------------------------------------
+    # Spill file
+    # ----------------------------------------------
+    async def _spill_overflow(self):
+        while self.overflow:
+            records, self.overflow = self.overflow, []
+            await self._spill(records)
+
+    async def _spill(self, records):
+        if not records:
+            return
+        self.metrics.spilled += len(records)
+        lines = ''.join(json.dumps(record) + '\n' for record in records)
+        async with self._spill_lock:
+            await asyncio.get_running_loop().run_in_executor(None, self._append, lines)
+
+    def _append(self, lines):
+        with open(self.spill_path, 'a', encoding='utf-8') as spillfile:
+            spillfile.write(lines)
+
+    def _take_spill_file(self):
+        try:
+            with open(self.spill_path, 'r', encoding='utf-8') as spillfile:
+                lines = spillfile.readlines()
+        except FileNotFoundError:
+            return []
+        os.remove(self.spill_path)
+        return [json.loads(line) for line in lines if line.strip()]
+
+    async def _replay(self):
+        async with self._spill_lock:
+            records = await asyncio.get_running_loop().run_in_executor(
+                None, self._take_spill_file
+            )
+        self.metrics.replayed += len(records)
+        for record in records:
+            # upload() spills the records again that don't fit into the queue
+            self.upload(record['data'], queued_at=record['queued_at'])
+
+
+# ================================================================================================
+# Self check
+# ================================================================================================
+
+async def self_check():
+    """Upload to a local stand-in server that fails, goes down and hangs on demand"""
+    import tempfile
+    from aiohttp import ClientSession, web
+
+    received = []
+    # Status codes to answer with before the next 200, 'hang' to never answer
+    script = []
+
+    async def handler(request):
+        data = await request.post()
+        if script:
+            action = script.pop(0)
+            if action == 'hang':
+                await asyncio.sleep(3600)
+            return web.Response(status=action)
+        received.append(data['message'])
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post('/chats', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    with tempfile.TemporaryDirectory() as directory:
+        spill_path = os.path.join(directory, 'spill.jsonl')
+
+        def spilled():
+            if not os.path.exists(spill_path):
+                return []
+            with open(spill_path, encoding='utf-8') as spillfile:
+                return [json.loads(line)['data']['message'] for line in spillfile]
+
+        async def wait_for(condition):
+            for _ in range(200):
+                if condition():
+                    return
+                await asyncio.sleep(0.01)
+            raise AssertionError('timed out')
+
+        async with ClientSession() as session:
+            uploader = EmkcUploader(
+                session, {}, url=f'http://127.0.0.1:{port}/chats', spill_path=spill_path,
+                concurrency=1, backoff_base=0.01,
+            )
+            uploader.start()
+
+            # Retry with backoff: 5xx and 429 are retried until they succeed
+            script[:] = [503, 429]
+            uploader.upload({'message': 'retried'})
+            await wait_for(lambda: received == ['retried'])
+            assert uploader.metrics.retried == 2, uploader.metrics
+            print('retry ok')
+
+            # Outage: a message that fails MAX_ATTEMPTS times is spilled
+            script[:] = [500] * MAX_ATTEMPTS
+            uploader.upload({'message': 'outage'})
+            await wait_for(lambda: spilled() == ['outage'])
+            print('spill ok')
+
+            # Replay: the next successful upload brings back the spilled message
+            uploader.upload({'message': 'after outage'})
+            await wait_for(lambda: sorted(received) == ['after outage', 'outage', 'retried'])
+            assert not os.path.exists(spill_path)
+            print('replay ok')
+
+            # Close while the server does not answer: the batch in flight is spilled
+            script[:] = ['hang']
+            for i in range(3):
+                uploader.upload({'message': f'in flight {i}'})
+            await wait_for(lambda: uploader._busy)
+            uploader.upload({'message': 'queued'})
+            await uploader.close(timeout=0.2)
+            assert sorted(spilled()) == ['in flight 0', 'in flight 1', 'in flight 2', 'queued'], \
+                spilled()
+            print('close ok')
+    await runner.cleanup()
+
+
+if __name__ == '__main__':
+    import sys
+    if sys.argv[1:] == ['check']:
+        asyncio.run(self_check())
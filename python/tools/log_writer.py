@@ -0,0 +1,130 @@
+"""Background writer for append only log files
+
+Lines are put on a queue and a single writer task coalesces them into bulk writes,
+either when batch_size lines are queued or flush_interval seconds after the first line of
+a batch. All file IO happens in a thread, so the event loop never waits for the disk.
+
+The file is rotated when it grows beyond max_bytes or when the day changes. Rotated files
+are renamed to <path>.<day>[.<n>] and gzip compressed, also off the event loop.
+"""
+
+import asyncio
+import gzip
+import os
+import shutil
+import traceback
+from datetime import date
+
+# Write at least every x seconds
+FLUSH_INTERVAL = 1
+# Write right away once this many lines are queued
+BATCH_SIZE = 500
+# Rotate the file once it is bigger than this
+MAX_BYTES = 50 * 1024 * 1024
+
+
+class LogWriter:
+    def __init__(self, path, max_bytes=MAX_BYTES, flush_interval=FLUSH_INTERVAL,
+                 batch_size=BATCH_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue = asyncio.Queue()
+        self.file = None
+        self.day = None
+        self._task = None
+
+    # ----------------------------------------------
+    # Event loop side
+    # ----------------------------------------------
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def write(self, line):
+        """Queue a line (without the trailing newline)"""
+        self.queue.put_nowait(line + '\n')
+
+    async def close(self):
+        """Write everything that is queued and close the file"""
+        if self._task is not None:
+            self.queue.put_nowait(None)
+            await self._task
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(None, self._close_file)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            line = await self.queue.get()
+            if line is None:
+                break
+            batch = [line]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if self.queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        line = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    line = self.queue.get_nowait()
+                if line is None:
+                    closing = True
+                    break
+                batch.append(line)
+            try:
+                await loop.run_in_executor(None, self._write_batch, batch)
+            except Exception:
+                # Keep the writer alive, losing a batch is better than losing the log
+                print(f'Ignoring exception while writing {len(batch)} lines to {self.path}')
+                traceback.print_exc()
+
+    # ----------------------------------------------
+    # Writer thread side
+    # ----------------------------------------------
+    def _open(self):
+        self.file = open(self.path, 'a', encoding='utf-8')
+        if self.file.tell():
+            # Continue the day of the existing log, it is rotated on the first write
+            # if it was started on a different day
+            self.day = date.fromtimestamp(os.path.getmtime(self.path))
+        else:
+            self.day = date.today()
+
+    def _close_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _write_batch(self, batch):
+        if self.file is None:
+            self._open()
+        if self.day != date.today() or self.file.tell() >= self.max_bytes:
+            self._rotate()
+        self.file.write(''.join(batch))
+        self.file.flush()
+
+    def _rotate(self):
+        if self.file.tell():
+            self._close_file()
+            rotated = f'{self.path}.{self.day.isoformat()}'
+            counter = 1
+            while os.path.exists(rotated) or os.path.exists(f'{rotated}.gz'):
+                rotated = f'{self.path}.{self.day.isoformat()}.{counter}'
+                counter += 1
+            os.replace(self.path, rotated)
+            self._compress(rotated)
+            self._open()
+        self.day = date.today()
+
+    @staticmethod
+    def _compress(path):
+        with open(path, 'rb') as src, gzip.open(f'{path}.gz', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
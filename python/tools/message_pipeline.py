@@ -0,0 +1,151 @@
+"""Shared message inspection pipeline
+
+Instead of every cog registering its own on_message listener (and repeating the same
+bot / DM / admin checks on the same message), cogs register a stage with the pipeline
+that lives on the bot (client.pipeline). The bot normalizes each message once into a
+MessageView and runs the stages in order. A stage returns True if it consumed the message
+(e.g. deleted it) - all later stages are skipped in that case.
+"""
+
+import re
+import time
+import traceback
+from dataclasses import dataclass, field
+from .url_filter import split_url
+
+URL_RE = re.compile(r'https?://[^\s<>]+', re.I)
+WHITESPACE_RE = re.compile(r'\s')
+# Matches up to the end of the last whitespace character
+LAST_WHITESPACE_RE = re.compile(r'.*\s', re.S)
+
+
+@dataclass
+class MessageView:
+    msg: object
+    # The raw message content
+    content: str
+    # The content without spoiler tags
+    text: str
+    # All http(s) urls found in text
+    urls: list
+    # (host, path) of every url, see url_filter.split_url
+    links: list
+    is_bot: bool
+    is_admin: bool
+
+    @classmethod
+    def from_message(cls, msg, client, content=None):
+        """
+        Keyword Arguments:
+            content {str} -- Text to inspect instead of msg.content, e.g. the changed
+                             part of an edited message (default: {None})
+        """
+        if content is None:
+            content = msg.content
+        text = content.replace('||', '')
+        urls = URL_RE.findall(text) if '://' in text else []
+        return cls(
+            msg=msg,
+            content=content,
+            text=text,
+            urls=urls,
+            links=[split_url(url) for url in urls],
+            is_bot=msg.author.bot,
+            is_admin=client.user_is_admin(msg.author),
+        )
+
+
+def _common_prefix_length(a, b):
+    """Binary search with slice comparisons, which are much faster than a loop over chars"""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def changed_span(before, after):
+    """Return (start, end) of the part of after that differs from before
+
+    The span is widened to whitespace, so every whitespace delimited word of after (urls,
+    invite links ...) outside of the span is also a word of before.
+    """
+    prefix = _common_prefix_length(before, after)
+    # The suffix must not overlap the prefix
+    limit = min(len(before), len(after)) - prefix
+    suffix = min(_common_prefix_length(before[::-1], after[::-1]), limit)
+    match = LAST_WHITESPACE_RE.match(after, 0, prefix)
+    start = match.end() if match else 0
+    match = WHITESPACE_RE.search(after, len(after) - suffix)
+    end = match.start() if match else len(after)
+    return start, max(start, end)
+
+
+@dataclass
+class Stage:
+    name: str
+    callback: object = field(repr=False)
+    order: int
+    bots: bool
+    calls: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+
+
+class MessagePipeline:
+    def __init__(self, on_error=None):
+        self.stages = []
+        # Coroutine that is called with (exception, source) if a stage raises
+        self.on_error = on_error
+
+    def register(self, name, callback, order=50, bots=False):
+        """Register a stage - an existing stage with the same name is replaced
+
+        Arguments:
+            name {str} -- Name of the stage (usually the cog name)
+            callback {coroutine function} -- Called with the MessageView,
+                                             returns True to stop the pipeline
+
+        Keyword Arguments:
+            order {int} -- Stages run in ascending order (default: {50})
+            bots {bool} -- Also run the stage for messages of bots (default: {False})
+        """
+        self.unregister(name)
+        self.stages.append(Stage(name, callback, order, bots))
+        self.stages.sort(key=lambda stage: (stage.order, stage.name))
+
+    def unregister(self, name):
+        self.stages = [stage for stage in self.stages if stage.name != name]
+
+    async def dispatch(self, view):
+        """Run all stages - return True if a stage consumed the message"""
+        for stage in self.stages:
+            if view.is_bot and not stage.bots:
+                continue
+            start = time.perf_counter()
+            try:
+                consumed = await stage.callback(view)
+            except Exception as e:
+                # A broken stage must not keep the other stages from running
+                consumed = False
+                print(f'Ignoring exception in message stage {stage.name}')
+                traceback.print_exc()
+                if self.on_error is not None:
+                    await self.on_error(e, f'Message stage {stage.name}')
+            elapsed = time.perf_counter() - start
+            stage.calls += 1
+            stage.total_time += elapsed
+            if elapsed > stage.max_time:
+                stage.max_time = elapsed
+            if consumed:
+                return True
+        return False
+
+    def reset_stats(self):
+        for stage in self.stages:
+            stage.calls = 0
+            stage.total_time = 0.0
+            stage.max_time = 0.0
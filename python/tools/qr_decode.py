@@ -0,0 +1,220 @@
+# ┌────────────────────────────────────────────────────────────────────────────┐
+# │                           QR CODE DECODER                                  │
+# │                                                                            │
+# │  Reverses the steps of tools/qr.py for clean, unrotated QR codes           │
+# └────────────────────────────────────────────────────────────────────────────┘
+# The decoder reads the format information, removes the mask, reads the codewords in placement
+# order, deinterleaves them into blocks and checks the Reed-Solomon syndromes of every block.
+# Errors are detected but not corrected, so it only works for QR codes that were rendered
+# (not photographed) - e.g. the output of the generator.
+
+import sys
+from io import BytesIO
+from operator import itemgetter
+from PIL import Image
+from .qr import generate_qr_code, get_template
+from .qr_segments import decode_segments
+from .qr_tools import QRMatrix, ALOG, LOG, BINARY_DIGITS
+from .qr_tables import ECC_INFO_TABLE, FORMAT_INFORMATION_STRINGS_TABLE
+
+
+class QRDecodeError(ValueError):
+    pass
+
+
+# (format information string, ecl, mask) of all 32 format information strings
+FORMATS = [
+    (format_string, ecl, mask)
+    for ecl, strings in enumerate(FORMAT_INFORMATION_STRINGS_TABLE)
+    for mask, format_string in enumerate(strings)
+]
+
+
+def read_format(modules, template):
+    """Return (ecl, mask) of the format information string that is closest to the matrix
+
+    Both copies of the format information are checked. The format information strings differ
+    in at least 7 bits, so up to 3 wrong bits are tolerated.
+    """
+    best = (16, None)
+    for positions in template.format_positions:
+        bits = ''.join('1' if modules[i] else '0' for i in positions)
+        for format_string, ecl, mask in FORMATS:
+            distance = sum(a != b for a, b in zip(bits, format_string))
+            if distance < best[0]:
+                best = (distance, (ecl, mask))
+    distance, format_info = best
+    if distance > 3:
+        raise QRDecodeError('Format information is unreadable')
+    return format_info
+
+
+def rs_syndromes_ok(codewords, num_ecc):
+    """Check that codewords (data + error correction) is a valid Reed-Solomon codeword
+
+    All syndromes (the codeword polynomial evaluated at 2**0 ... 2**(num_ecc-1)) must be 0
+    """
+    for i in range(num_ecc):
+        syndrome = 0
+        for codeword in codewords:
+            # syndrome = syndrome * 2**i + codeword
+            if syndrome:
+                syndrome = ALOG[(LOG[syndrome] + i) % 255]
+            syndrome ^= codeword
+        if syndrome:
+            return False
+    return True
+
+
+def decode_matrix(matrix):
+    """Return the data of a QRMatrix with 0 for light and 1 for dark modules
+
+    Raises QRDecodeError if the matrix is not a valid QR code
+    """
+    size = matrix.size
+    version, remainder = divmod(size - 17, 4)
+    if remainder or not 1 <= version <= 40:
+        raise QRDecodeError(f'{size} is not a valid QR code size')
+    template = get_template(version)
+    modules = matrix.modules
+    ecl, mask = read_format(modules, template)
+
+    # Remove the mask and read the data modules in placement order
+    unmasked = (int.from_bytes(modules, 'big') ^ template.mask_patterns[mask]).to_bytes(
+        size * size, 'big'
+    )
+    bits = bytes(itemgetter(*template.placement)(unmasked)).translate(BINARY_DIGITS)
+    codewords = [int(bits[i:i+8], 2) for i in range(0, len(bits) - 7, 8)]
+
+    # Deinterleave the codewords into blocks
+    num_ecc, num_blocks_1, block_len_1, num_blocks_2, block_len_2 = ECC_INFO_TABLE[version][ecl]
+    block_lengths = [block_len_1] * num_blocks_1 + [block_len_2] * num_blocks_2
+    blocks = [[] for _ in block_lengths]
+    position = 0
+    for i in range(max(block_lengths)):
+        for block, block_len in zip(blocks, block_lengths):
+            if i < block_len:
+                block.append(codewords[position])
+                position += 1
+    data = [codeword for block in blocks for codeword in block]
+    for i in range(num_ecc):
+        for block in blocks:
+            block.append(codewords[position])
+            position += 1
+    for number, block in enumerate(blocks, 1):
+        if not rs_syndromes_ok(block, num_ecc):
+            raise QRDecodeError(f'Error correction check failed for block {number}')
+
+    data_bits = ''.join(bin(codeword)[2:].zfill(8) for codeword in data)
+    try:
+        return decode_segments(data_bits, version)
+    except ValueError as e:
+        raise QRDecodeError(str(e))
+
+
+def matrix_from_image(image_bytes):
+    """Read the modules of a clean, unrotated QR code image (e.g. a PNG of the generator)
+
+    The module width is taken from the top left finder pattern (7 modules wide), the
+    modules are sampled in their center.
+    """
+    try:
+        image = Image.open(BytesIO(image_bytes))
+        image = image.convert('L')
+    except (OSError, Image.DecompressionBombError):
+        raise QRDecodeError('The file is not a supported image')
+    # Dark pixels become 1
+    dark = image.point(lambda value: 1 if value < 128 else 0)
+    bbox = dark.getbbox()
+    if bbox is None:
+        raise QRDecodeError('No QR code found')
+    left, top, right, bottom = bbox
+    width = right - left
+    pixels = dark.tobytes()
+    first_row = pixels[top * image.width + left:top * image.width + right]
+    finder_width = len(first_row) - len(first_row.lstrip(b'\x01'))
+    size = round(7 * width / finder_width) if finder_width else 0
+    if (size - 17) % 4 or not 21 <= size <= 177 or abs((bottom - top) - width) > width / size:
+        raise QRDecodeError('No QR code found (only clean, unrotated images are supported)')
+    module_width = width / size
+    centers = [int((i + 0.5) * module_width) for i in range(size)]
+    modules = bytearray(
+        pixels[(top + y) * image.width + left + x] for y in centers for x in centers
+    )
+    return QRMatrix(size, modules)
+
+
+def decode_image(image_bytes):
+    """Return the data of a QR code image, see matrix_from_image"""
+    return decode_matrix(matrix_from_image(image_bytes))
+
+
+# ================================================================================================
+# Round trip check
+# ================================================================================================
+
+def round_trip_check(seed=0, rounds=1):
+    """Generate random QR codes for every version, error correction level and mode, decode them
+    and compare the result with the data
+
+    The data of each code is just long enough to need the version. Every 8th code is decoded
+    from its PNG and every code is also checked to fail after a data module was flipped.
+    """
+    import random
+    from .qr_tables import CHAR_CAPACITY_TABLE, ALPHANUM_ENCODING_TABLE
+    rng = random.Random(seed)
+    # Characters that can only be encoded in the mode (and the modes after it), so no
+    # segmentation can make the data fit into a smaller version
+    alphabets = [
+        '0123456789',
+        ''.join(char for char in ALPHANUM_ENCODING_TABLE if not char.isdigit()),
+        'abcdefghijklmnopqrstuvwxyz_?=&ßéü',
+    ]
+    checked = 0
+    for _ in range(rounds):
+        for version in range(1, 41):
+            for ecl in range(4):
+                for mode, alphabet in enumerate(alphabets):
+                    capacities = CHAR_CAPACITY_TABLE[version - 1:version + 1]
+                    min_len = capacities[0][ecl][mode] + 1 if version > 1 else 1
+                    length = rng.randint(min_len, capacities[-1][ecl][mode])
+                    data = ''.join(rng.choice(alphabet) for _ in range(length))
+                    matrix = generate_qr_code(data, ecl, output='matrix')
+                    assert matrix.size == 17 + 4 * version, (data, version, ecl)
+                    assert decode_matrix(matrix) == data, (data, version, ecl)
+                    if checked % 8 == 0:
+                        pixel_size = rng.randint(1, 4)
+                        png = generate_qr_code(data, ecl, output='png',
+                                               png_pixel_size=pixel_size).getvalue()
+                        assert decode_image(png) == data, (data, version, ecl, pixel_size)
+                    # Flip a module of a codeword (not one of the remainder bits)
+                    placement = get_template(version).placement
+                    index = rng.choice(placement[:len(placement) // 8 * 8])
+                    matrix.modules[index] ^= 1
+                    try:
+                        decode_matrix(matrix)
+                    except QRDecodeError:
+                        pass
+                    else:
+                        raise AssertionError(f'Flipped module not detected {version} {ecl}')
+                    checked += 1
+        # Mixed mode data of random length
+        for _ in range(40):
+            ecl = rng.randrange(4)
+            data = ''.join(
+                rng.choice(rng.choice(alphabets + ['✓äöü€ '])) * rng.randint(1, 30)
+                for _ in range(rng.randint(1, 20))
+            )
+            assert decode_matrix(generate_qr_code(data, ecl, output='matrix')) == data, data
+            checked += 1
+    print(f'{checked} QR codes decoded')
+
+
+if __name__ == '__main__':
+    # python -m tools.qr_decode check [seed] [rounds]
+    # python -m tools.qr_decode FILE
+    if sys.argv[1:2] == ['check']:
+        round_trip_check(*map(int, sys.argv[2:4]))
+    elif len(sys.argv) == 2:
+        with open(sys.argv[1], 'rb') as f:
+            print(decode_image(f.read()))
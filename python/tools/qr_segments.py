@@ -0,0 +1,260 @@
+# ┌────────────────────────────────────────────────────────────────────────────┐
+# │                        QR CODE DATA SEGMENTATION                           │
+# │                                                                            │
+# │  Based on https://www.thonky.com/qr-code-tutorial/data-encoding            │
+# │  and https://www.nayuki.io/page/optimal-text-segmentation-for-qr-codes     │
+# └────────────────────────────────────────────────────────────────────────────┘
+# A QR code can contain multiple segments with different modes. For example an URL with a long
+# numeric id is shorter as a byte segment followed by a numeric segment than in byte mode only.
+# Every segment costs a mode indicator and a character count indicator (whose length depends
+# on the version), so switching is only worth it for long enough runs. The segmentation with
+# the smallest number of bits is found with dynamic programming over the characters.
+
+import sys
+from .qr_tables import ALPHANUM_ENCODING_TABLE, CHARCOUNT_INDICATOR_LENGTHS_TABLE
+from .qr_tables import CHAR_CAPACITY_TABLE, ECC_INFO_TABLE
+
+NUMERIC, ALPHANUMERIC, BYTE = 0, 1, 2
+MODE_NAMES = ['Numeric', 'Alphanumeric', 'Byte', 'Kanji']
+MODE_INDICATORS = ['0001', '0010', '0100', '1000']
+MODES = (NUMERIC, ALPHANUMERIC, BYTE)
+# Character modes of a character that can only be encoded in byte mode
+BYTE_ONLY = (BYTE, BYTE, BYTE)
+
+# The costs are in 1/6 bits so numeric (10 bits per 3 characters) and alphanumeric
+# (11 bits per 2 characters) characters have integer costs
+NUMERIC_COST = 20
+ALPHANUMERIC_COST = 33
+BYTE_COST = 48
+
+
+def get_charcount_indicator_length(version, mode):
+    for max_version, counts in CHARCOUNT_INDICATOR_LENGTHS_TABLE.items():
+        if version <= max_version:
+            return counts[mode]
+
+
+def get_data_bits(version, ecl):
+    """Return the number of data bits of a QR code"""
+    _, num_blocks_1, codewords_per_block_1, num_blocks_2, codewords_per_block_2 = (
+        ECC_INFO_TABLE[version][ecl]
+    )
+    return 8 * (num_blocks_1 * codewords_per_block_1 + num_blocks_2 * codewords_per_block_2)
+
+
+def get_byte_encoding(data):
+    """Byte mode uses ISO 8859-1 by default, UTF-8 is used if data can't be encoded with it
+
+    Most readers detect UTF-8 data, so no ECI segment is added
+    """
+    try:
+        data.encode('latin-1')
+        return 'latin-1'
+    except UnicodeEncodeError:
+        return 'utf-8'
+
+
+def get_segments(data, version, encoding='latin-1'):
+    """Return the shortest list of (mode, text) segments for data in a QR code of version"""
+    if not data:
+        return []
+    head_costs = [
+        (4 + get_charcount_indicator_length(version, mode)) * 6 for mode in MODES
+    ]
+    infinity = float('inf')
+    costs = head_costs
+    # char_modes[i][m]: the mode of character i on the cheapest path that continues in mode m
+    char_modes = []
+    for char in data:
+        byte_cost = costs[BYTE] + BYTE_COST * len(char.encode(encoding))
+        if char not in ALPHANUM_ENCODING_TABLE:
+            # Only byte mode is possible (the common case for text)
+            switch_cost = (byte_cost + 5) // 6 * 6
+            costs = [
+                switch_cost + head_costs[NUMERIC],
+                switch_cost + head_costs[ALPHANUMERIC],
+                byte_cost,
+            ]
+            char_modes.append(BYTE_ONLY)
+            continue
+        new_costs = [infinity, costs[ALPHANUMERIC] + ALPHANUMERIC_COST, byte_cost]
+        modes = [None, ALPHANUMERIC, BYTE]
+        if char.isdigit():
+            new_costs[NUMERIC] = costs[NUMERIC] + NUMERIC_COST
+            modes[NUMERIC] = NUMERIC
+        # Switch to another mode after this character (the segment ends on a full bit)
+        for to_mode in MODES:
+            for from_mode in MODES:
+                if modes[from_mode] is None:
+                    continue
+                cost = (new_costs[from_mode] + 5) // 6 * 6 + head_costs[to_mode]
+                if modes[to_mode] is None or cost < new_costs[to_mode]:
+                    new_costs[to_mode] = cost
+                    modes[to_mode] = from_mode
+        char_modes.append(modes)
+        costs = new_costs
+
+    # Walk back from the cheapest end state
+    mode = min(MODES, key=lambda m: costs[m])
+    path = []
+    for modes in reversed(char_modes):
+        mode = modes[mode]
+        path.append(mode)
+    path.reverse()
+
+    segments = []
+    start = 0
+    for i in range(1, len(data) + 1):
+        if i == len(data) or path[i] != path[start]:
+            segments.append((path[start], data[start:i]))
+            start = i
+    return segments
+
+
+def encode_segments(segments, version, encoding='latin-1'):
+    """Return the bits (as a str of 0 and 1) of the segments"""
+    bits = []
+    for mode, text in segments:
+        if mode == BYTE:
+            text = text.encode(encoding)
+        bits.append(MODE_INDICATORS[mode])
+        bits.append(bin(len(text))[2:].zfill(get_charcount_indicator_length(version, mode)))
+        if mode == NUMERIC:
+            # Groups of 3 digits in 10 bits, a remaining group of 2 or 1 in 7 or 4 bits
+            for i in range(0, len(text), 3):
+                num = text[i:i+3]
+                bits.append(bin(int(num))[2:].zfill((4, 7, 10)[len(num) - 1]))
+        elif mode == ALPHANUMERIC:
+            # Pairs of characters in 11 bits (45 * first + second), a remaining one in 6 bits
+            for i in range(0, len(text), 2):
+                pair = text[i:i+2]
+                if len(pair) == 2:
+                    n = 45 * ALPHANUM_ENCODING_TABLE[pair[0]] + ALPHANUM_ENCODING_TABLE[pair[1]]
+                    bits.append(bin(n)[2:].zfill(11))
+                else:
+                    bits.append(bin(ALPHANUM_ENCODING_TABLE[pair])[2:].zfill(6))
+        else:
+            bits.extend(bin(byte)[2:].zfill(8) for byte in text)
+    return ''.join(bits)
+
+
+def encode_data(data, ecl):
+    """Return (version, segments, bits) for the smallest QR code version that fits data
+
+    The segments only change with the length of the character count indicators, so they are
+    computed once per version group.
+    """
+    encoding = get_byte_encoding(data)
+    # No segmentation can use less bits than every character in its cheapest mode
+    min_bits = sum(
+        NUMERIC_COST if char.isdigit() and char in ALPHANUM_ENCODING_TABLE
+        else ALPHANUMERIC_COST if char in ALPHANUM_ENCODING_TABLE
+        else BYTE_COST * len(char.encode(encoding))
+        for char in data
+    ) // 6
+    group_min_version = 1
+    for group_max_version in CHARCOUNT_INDICATOR_LENGTHS_TABLE:
+        if min_bits > get_data_bits(group_max_version, ecl) and group_max_version < 40:
+            group_min_version = group_max_version + 1
+            continue
+        segments = get_segments(data, group_min_version, encoding)
+        bits = encode_segments(segments, group_min_version, encoding)
+        for version in range(group_min_version, group_max_version + 1):
+            if len(bits) <= get_data_bits(version, ecl):
+                return version, segments, bits
+        group_min_version = group_max_version + 1
+    raise ValueError(
+        f'Too much data ({len(bits)}/{get_data_bits(40, ecl)} bits). '
+        f'Use less data or lower error correction'
+    )
+
+
+def decode_segments(bits, version, encoding=None):
+    """Decode the bits of the segments (the inverse of encode_segments)
+
+    Decoding stops at the terminator (0000) or when there are no more bits for a mode
+    indicator. If no encoding is given, byte segments are decoded as UTF-8 if possible and
+    as ISO 8859-1 otherwise.
+    Raises ValueError for modes that are not supported (Kanji, ECI ...)
+    """
+    alphanum = {value: char for char, value in ALPHANUM_ENCODING_TABLE.items()}
+    data = []
+    pos = 0
+
+    def read(length):
+        nonlocal pos
+        if pos + length > len(bits):
+            raise ValueError('Data ends in the middle of a segment')
+        pos += length
+        return int(bits[pos - length:pos], 2)
+
+    while pos + 4 <= len(bits) and bits[pos:pos+4] != '0000':
+        indicator = bits[pos:pos+4]
+        if indicator not in MODE_INDICATORS[:3]:
+            raise ValueError(f'Unsupported mode indicator {indicator}')
+        mode = MODE_INDICATORS.index(indicator)
+        pos += 4
+        count = read(get_charcount_indicator_length(version, mode))
+        if mode == NUMERIC:
+            for i in range(0, count, 3):
+                digits = min(3, count - i)
+                data.append(str(read((4, 7, 10)[digits - 1])).zfill(digits))
+        elif mode == ALPHANUMERIC:
+            for i in range(0, count, 2):
+                if count - i >= 2:
+                    n = read(11)
+                    data.append(alphanum[n // 45] + alphanum[n % 45])
+                else:
+                    data.append(alphanum[read(6)])
+        else:
+            text = bytes(read(8) for _ in range(count))
+            if encoding is not None:
+                data.append(text.decode(encoding))
+                continue
+            try:
+                data.append(text.decode('utf-8'))
+            except UnicodeDecodeError:
+                data.append(text.decode('latin-1'))
+    return ''.join(data)
+
+
+# ================================================================================================
+# Self check
+# ================================================================================================
+
+def self_check():
+    """Check the segmenter against CHAR_CAPACITY_TABLE and decode some mixed data"""
+    samples = {NUMERIC: '7', ALPHANUMERIC: 'A', BYTE: 'a'}
+    for version in range(1, 41):
+        for ecl in range(4):
+            for mode in MODES:
+                capacity = CHAR_CAPACITY_TABLE[version][ecl][mode]
+                # Data of exactly the capacity of a version fits into that version
+                assert encode_data(samples[mode] * capacity, ecl)[0] == version
+                # ... but not one character more
+                try:
+                    assert encode_data(samples[mode] * (capacity + 1), ecl)[0] > version
+                except ValueError:
+                    assert version == 40
+    print('capacity check ok (40 versions x 4 levels x 3 modes)')
+
+    for data in (
+        'https://discord.com/channels/473161189120147456/484183734140928021',
+        'HELLO WORLD 1234567890123 hello',
+        '0123456789012345678901234567890123456789',
+        'Grüße aus Köln',
+        'Unicode ✓ 123456789012',
+    ):
+        version, segments, bits = encode_data(data, 0)
+        encoding = get_byte_encoding(data)
+        assert decode_segments(bits, version, encoding) == data
+        single = encode_segments([(BYTE, data)], version, encoding)
+        modes = ', '.join(f'{MODE_NAMES[mode]}({len(text)})' for mode, text in segments)
+        print(f'{len(bits):>5} bits (byte mode only: {len(single):>5}) version {version:>2}: '
+              f'{modes}')
+
+
+if __name__ == '__main__':
+    # python -m tools.qr_segments check
+    if sys.argv[1:] == ['check']:
+        self_check()
@@ -0,0 +1,122 @@
+"""Generate (and decode) QR codes in worker processes without blocking the event loop
+
+Large codes (version 40, PNG output) take long enough to stall every other command and
+listener, so they are generated in a small process pool. At most max_pending codes are
+queued or being generated at the same time, further requests are rejected with QueueFull.
+
+The final results (PNG bytes or strings) are kept in an LRU cache keyed by
+(data, ecl, output, pixel_size) and concurrent requests for the same key share one job.
+
+The workers are forked: the spawn and forkserver start methods would import bot.py again
+(which has no __main__ guard) in every worker. Forking a process with running threads
+(event loop executor, aiosqlite, aiohttp resolver) can copy locks that are held by them, so
+bot.py calls start_pool() before the client starts. The pool is shared by all QRServices and
+survives cog reloads.
+"""
+
+import asyncio
+import hashlib
+import multiprocessing
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from .qr import generate_qr_code
+from .qr_decode import decode_image
+
+
+MAX_WORKERS = 2
+
+# Shared process pool, see start_pool
+_executor = None
+
+
+class QueueFull(Exception):
+    pass
+
+
+def start_pool(max_workers=MAX_WORKERS):
+    """Start the worker processes of the shared pool and return it
+
+    Call this before any threads are started. Without it the pool is started on first use.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers, mp_context=multiprocessing.get_context('fork')
+        )
+        # Workers may be started on demand when no worker is idle: submit one job per worker
+        # before the first one can finish so all of them are forked now
+        jobs = [_executor.submit(time.sleep, 0.1) for _ in range(max_workers)]
+        for job in jobs:
+            job.result()
+    return _executor
+
+
+def shutdown_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _generate(data, ecl, output, pixel_size):
+    # Runs in a worker process, the result has to be picklable
+    result = generate_qr_code(data, ecl, output=output, png_pixel_size=pixel_size)
+    if output == 'png':
+        return result.getvalue()
+    return result
+
+
+class QRService:
+    def __init__(self, max_pending=8, cache_size=256):
+        """
+        Keyword Arguments:
+            max_pending {int} -- Maximum number of queued + running jobs (default: {8})
+            cache_size {int} -- Number of cached results (default: {256})
+        """
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        # key -> Future of the running job
+        self.running = {}
+
+    async def _run(self, key, function, *args):
+        """Run function in the pool, concurrent calls with the same key share one job"""
+        future = self.running.get(key)
+        if future is None:
+            if len(self.running) >= self.max_pending:
+                raise QueueFull('Too many QR codes are being processed, try again later')
+            future = asyncio.get_running_loop().run_in_executor(
+                start_pool(), function, *args
+            )
+            self.running[key] = future
+            future.add_done_callback(lambda _: self.running.pop(key, None))
+        # Shielded so a cancelled command doesn't cancel the job of the other waiters
+        return await asyncio.shield(future)
+
+    async def generate(self, data, ecl, output, pixel_size=None):
+        """Return the QR code for data - see generate_qr_code
+
+        Raises QueueFull if too many codes are being generated and ValueError if data does
+        not fit into a QR code.
+        """
+        key = (data, ecl, output, pixel_size)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        result = await self._run(key, _generate, data, ecl, output, pixel_size or 10)
+        self.cache[key] = result
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+    async def decode(self, image_bytes):
+        """Return the data of a QR code image - see decode_image
+
+        Raises QueueFull if too many codes are being processed and QRDecodeError if the
+        image can't be decoded.
+        """
+        # Keyed by a digest so the running jobs don't keep the images alive
+        key = ('decode', hashlib.sha256(image_bytes).digest())
+        return await self._run(key, decode_image, image_bytes)
@@ -1,5 +1,7 @@
+import zlib
 from PIL import Image
 from io import BytesIO
+from functools import lru_cache
 
 
 def GF2_create_tables(order, irreducible_polynomial):
@@ -175,118 +177,398 @@ class Polynomial_GF256_int(Polynomial_GF256_base):
         return Polynomial_GF256_int(self)
 
 
+# ================================================================================================
+# Reed-Solomon encoding
+# ================================================================================================
+# The error correction codewords of a block are the remainder of the division of the message
+# polynomial (multiplied by x**n) by the generator polynomial for n error correction codewords.
+# The division is done by a linear feedback shift register: the register holds the n
+# codewords of the remainder so far. For every message codeword the first register codeword is
+# shifted out, XORed with the message codeword (feedback) and the generator polynomial
+# multiplied by the feedback is XORed into the register.
+# The register is an int of n bytes and the product of the generator polynomial with every
+# possible feedback value is precomputed, so every message codeword costs a shift and an XOR.
+
+@lru_cache(maxsize=None)
+def get_generator_polynomial(num_ecc):
+    """Return the generator polynomial for num_ecc error correction codewords (integer form)
+
+    The generator Polynomial is created by multiplying (x - 2**0) ... (x - 2**(num_ecc-1))
+    """
+    generator_poly = Polynomial_GF256_exp([0, 0])
+    for i in range(1, num_ecc):
+        generator_poly = generator_poly * Polynomial_GF256_exp([0, i])
+    return generator_poly.to_int()
+
+
+@lru_cache(maxsize=None)
+def get_rs_feedback_table(num_ecc):
+    """Return the generator polynomial (without its leading term) multiplied by 0 ... 255
+
+    Each product is an int of num_ecc bytes
+    """
+    generator_exp = get_generator_polynomial(num_ecc).to_exp()[1:]
+    table = [0]
+    for factor in range(1, 256):
+        table.append(int.from_bytes(bytes(
+            ALOG[(LOG[factor] + exponent) % 255] if exponent is not None else 0
+            for exponent in generator_exp
+        ), 'big'))
+    return table
+
+
+def rs_encode(block, num_ecc):
+    """Return the num_ecc error correction codewords for the data codewords in block"""
+    table = get_rs_feedback_table(num_ecc)
+    shift = 8 * (num_ecc - 1)
+    register_mask = (1 << (8 * num_ecc)) - 1
+    register = 0
+    for codeword in block:
+        feedback = codeword ^ (register >> shift)
+        register = ((register << 8) & register_mask) ^ table[feedback]
+    return bytearray(register.to_bytes(num_ecc, 'big'))
+
+
+# Value of modules that have not been set yet
+EMPTY = 255
+
+
+class QRMatrix:
+    """Square matrix of modules stored row by row in a flat bytearray
+
+    Modules are addressed with matrix[x, y] and have the values
+        0 - white module
+        1 - black module
+        2 - reserved module
+        EMPTY - module that was not set yet
+    Positions outside of the matrix are never "in" the matrix, writes to them are ignored.
+    """
+    __slots__ = ('size', 'modules')
+
+    def __init__(self, size, modules=None):
+        self.size = size
+        self.modules = bytearray([EMPTY]) * (size * size) if modules is None else modules
+
+    def __getitem__(self, pos):
+        x, y = pos
+        return self.modules[y * self.size + x]
+
+    def __setitem__(self, pos, value):
+        x, y = pos
+        if 0 <= x < self.size and 0 <= y < self.size:
+            self.modules[y * self.size + x] = value
+
+    def __contains__(self, pos):
+        x, y = pos
+        return (
+            0 <= x < self.size and 0 <= y < self.size
+            and self.modules[y * self.size + x] != EMPTY
+        )
+
+    def copy(self):
+        return QRMatrix(self.size, self.modules[:])
+
+    def rows(self):
+        """Return the rows as bytes objects"""
+        size, modules = self.size, self.modules
+        return [bytes(modules[i:i+size]) for i in range(0, size * size, size)]
+
+    def packed(self):
+        """Return the rows and the columns packed into one int each
+
+        Every module is one bit and the lines are separated by a 0 guard bit, so
+        one line is size + 1 bits wide. Only works for matrices that contain 0 and 1 only.
+        """
+        size = self.size
+        text = self.modules.translate(BINARY_DIGITS)
+        rows = b'0'.join([text[i:i+size] for i in range(0, size * size, size)])
+        columns = b'0'.join([text[x::size] for x in range(size)])
+        return int(rows, 2), int(columns, 2)
+
+
+# Translation table for QRMatrix.packed - module values to the ascii digits 0 and 1
+BINARY_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+
+
+@lru_cache(maxsize=None)
+def packed_line_masks(size):
+    """Return masks for ints packed by QRMatrix.packed
+
+    pairs: bits of all modules that have a left neighbour in the same line
+    windows: bits of all modules that start an 11 module window in the same line
+    """
+    pairs = b'0'.join([b'0' + b'1' * (size - 1)] * size)
+    windows = b'0'.join([b'1' * max(size - 10, 0) + b'0' * min(10, size)] * size)
+    return int(pairs, 2), int(windows, 2)
+
+
+# ================================================================================================
+# Text output
+# ================================================================================================
+# Light modules are drawn with block characters (light text on a dark background), every style
+# adds a one module border. The length of the output only depends on the size of the matrix,
+# so the largest style that fits into a length limit can be picked before rendering.
+
 def get_matrix_str_full_size(matrix):
+    """2 characters per module"""
     border = '██'
-    colors = ['██', '  ', '▒▒', '░░']
-    max_x = max([x for x, y in matrix.keys()])
-    min_x = min([x for x, y in matrix.keys()])
-    max_y = max([y for x, y in matrix.keys()])
-    min_y = min([y for x, y in matrix.keys()])
-    res = ''
-    res += border*(max_x+3) + '\n'
-    for y in range(min_y, max_y+1):
-        res += border
-        for x in range(min_x, max_x+1):
-            res += colors[matrix.get((x, y), -1)]
-        res += border + '\n'
-    res += border*(max_x+3) + '\n'
-    return res
+    colors = ['██', '  ', '▒▒'] + ['░░'] * 253
+    res = [border * (matrix.size + 2)]
+    for row in matrix.rows():
+        res.append(border + ''.join([colors[module] for module in row]) + border)
+    res.append(border * (matrix.size + 2))
+    return '\n'.join(res) + '\n'
 
 
 def get_matrix_str_half_size(matrix):
+    """1 character per 2 modules (stacked)"""
     top = '▀'
     bottom = '▄'
     full = '█'
     empty = ' '
     colors = [[full, top], [bottom, empty]]
-    max_x = max([x for x, y in matrix.keys()])
-    min_x = min([x for x, y in matrix.keys()])
-    max_y = max([y for x, y in matrix.keys()])
-    min_y = min([y for x, y in matrix.keys()])
-    res = ''
-    res += bottom*(max_x+3) + '\n'
-    for y in range(min_y, max_y+1, 2):
-        res += full
-        for x in range(min_x, max_x+1):
-            res += colors[matrix.get((x, y), 0)][matrix.get((x, y+1), 0)]
-        res += full + '\n'
-    # res += *(max_x+3) + '\n'
-    return res
-
-
-def get_matrix_png(matrix, module_width_px=10):
-    max_x = max([x for x, y in matrix.keys()])
-    min_x = min([x for x, y in matrix.keys()])
-    max_y = max([y for x, y in matrix.keys()])
-    min_y = min([y for x, y in matrix.keys()])
-
-    img = Image.new('RGB', (module_width_px * (max_x-min_x+3), module_width_px * (max_y-min_y+3)))
-    # Top Border
-    img.paste(
-        'white',
-        (
-            0,
-            0,
-            module_width_px * (max_x-min_x+3),
-            module_width_px
-        )
+    rows = matrix.rows()
+    if len(rows) % 2:
+        # Odd number of rows, the lower half of the last line is white
+        rows.append(bytes(matrix.size))
+    res = [bottom * (matrix.size + 2)]
+    for upper, lower in zip(rows[::2], rows[1::2]):
+        res.append(full + ''.join([colors[u][l] for u, l in zip(upper, lower)]) + full)
+    return '\n'.join(res) + '\n'
+
+
+def _get_light_lines(matrix, height):
+    """Return the rows (with border) as ints with a set bit for every light module
+
+    Bit 0 is the left border, the number of rows is padded with 0 to a multiple of height
+    """
+    width = matrix.size + 2
+    # Rows are read most significant bit first, so they are reversed for bit 0 to be the left
+    light = bytes.maketrans(b'\x00\x01', b'10')
+    lines = [(1 << width) - 1]
+    for row in matrix.rows():
+        lines.append(int(b'1' + row.translate(light)[::-1] + b'1', 2))
+    lines.append((1 << width) - 1)
+    lines.extend([0] * (-len(lines) % height))
+    return lines
+
+
+# Block characters for 2x2 modules
+# bit 0: upper left, 1: upper right, 2: lower left, 3: lower right
+QUADRANTS = ' ▘▝▀▖▌▞▛▗▚▐▜▄▙▟█'
+
+
+def get_matrix_str_quadrant(matrix):
+    """1 character per 2x2 modules"""
+    lines = _get_light_lines(matrix, 2)
+    columns = range(0, matrix.size + 2, 2)
+    res = []
+    for upper, lower in zip(lines[::2], lines[1::2]):
+        res.append(''.join([
+            QUADRANTS[(upper >> x & 3) | (lower >> x & 3) << 2] for x in columns
+        ]))
+    return '\n'.join(res) + '\n'
+
+
+# Braille dots of the left and the right column from top to bottom
+BRAILLE_DOTS = ((0x01, 0x02, 0x04, 0x40), (0x08, 0x10, 0x20, 0x80))
+# The braille character for the light modules of a 2x4 cell: bit 2 * row + column is set for a
+# light module (like the 2 bit pairs of 4 rows are read from the lines)
+BRAILLE = ''.join(
+    chr(0x2800 + sum(
+        dot for column, dots in enumerate(BRAILLE_DOTS) for row, dot in enumerate(dots)
+        if cell >> (2 * row + column) & 1
+    ))
+    for cell in range(256)
+)
+
+
+def get_matrix_str_braille(matrix):
+    """1 character per 2x4 modules (braille dots) - the most compact and least readable style"""
+    lines = _get_light_lines(matrix, 4)
+    columns = range(0, matrix.size + 2, 2)
+    res = []
+    for l0, l1, l2, l3 in zip(lines[::4], lines[1::4], lines[2::4], lines[3::4]):
+        res.append(''.join([
+            BRAILLE[(l0 >> x & 3) | (l1 >> x & 3) << 2 | (l2 >> x & 3) << 4 | (l3 >> x & 3) << 6]
+            for x in columns
+        ]))
+    return '\n'.join(res) + '\n'
+
+
+# Text styles from the largest (most readable) to the smallest
+TEXT_STYLES = {
+    'full': get_matrix_str_full_size,
+    'half': get_matrix_str_half_size,
+    'quadrant': get_matrix_str_quadrant,
+    'braille': get_matrix_str_braille,
+}
+
+
+def get_text_length(size, style):
+    """Return the length of the text output of a size x size matrix (including newlines)"""
+    width = size + 2
+    if style == 'full':
+        return width * (2 * width + 1)
+    elif style == 'half':
+        return (1 + (size + 1) // 2) * (width + 1)
+    elif style == 'quadrant':
+        return (width + 1) // 2 * ((width + 1) // 2 + 1)
+    elif style == 'braille':
+        return (width + 3) // 4 * ((width + 1) // 2 + 1)
+    raise ValueError(f'Unknown text style {style}')
+
+
+def get_text_style(size, max_length, styles=tuple(TEXT_STYLES)):
+    """Return the first of styles whose output fits into max_length or None"""
+    for style in styles:
+        if get_text_length(size, style) <= max_length:
+            return style
+    return None
+
+
+def _png_chunk(chunk_type, data):
+    return (
+        len(data).to_bytes(4, 'big') + chunk_type + data
+        + zlib.crc32(chunk_type + data).to_bytes(4, 'big')
     )
 
-    for y in range(min_y, max_y+1):
-        posy = (y+1)*module_width_px
-        # Left border (current line)
-        img.paste(
-            'white',
-            (
-                0,
-                posy,
-                module_width_px,
-                posy + module_width_px
-            )
-        )
-        # Data (current line)
-        for x in range(min_x, max_x+1):
-            posx = (x+1)*module_width_px
-            color = 'white' if matrix.get((x, y), -1) == 0 else 'black'
-            img.paste(
-                color,
-                (
-                    posx,
-                    posy,
-                    posx + module_width_px,
-                    posy + module_width_px
-                )
-            )
-
-        # Right border (current line)
-        img.paste(
-            'white',
-            (
-                (max_x + 2) * module_width_px,
-                posy,
-                (max_x + 3) * module_width_px,
-                posy + module_width_px
-            )
-        )
-
-    # Bottom Border
-    img.paste(
-        'white',
-        (
-            0,
-            module_width_px * (max_y-min_y+2),
-            module_width_px * (max_x-min_x+3),
-            module_width_px * (max_y-min_y+3)
-        )
-    )
 
+def get_matrix_png(matrix, module_width_px=10):
+    """Return a black and white PNG of matrix with a one module border
+
+    The PNG is written directly as a 1-bit grayscale image: every module line is packed into
+    bits once. The other lines of the same module line are identical, so they are written
+    with the "Up" filter (difference to the line above) which makes them all zeroes and lets
+    them compress to almost nothing.
+    """
+    width = (matrix.size + 2) * module_width_px
+    line_bytes = (width + 7) // 8
+    padding = b'0' * (line_bytes * 8 - width)
+    # Bits of one module, light modules (0) are white (1)
+    module_bits = (b'1' * module_width_px, b'0' * module_width_px)
+    border = module_bits[0]
+    repeated_lines = (b'\x02' + bytes(line_bytes)) * (module_width_px - 1)
+
+    def module_line(bits):
+        return b'\x00' + int(bits + padding, 2).to_bytes(line_bytes, 'big') + repeated_lines
+
+    compressor = zlib.compressobj()
+    border_line = module_line(border * (matrix.size + 2))
+    image_data = [compressor.compress(border_line)]
+    for row in matrix.rows():
+        bits = b''.join([module_bits[module != 0] for module in row])
+        image_data.append(compressor.compress(module_line(border + bits + border)))
+    image_data.append(compressor.compress(border_line))
+    image_data.append(compressor.flush())
+
+    header = width.to_bytes(4, 'big') * 2 + bytes([1, 0, 0, 0, 0])
+    return BytesIO(b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        _png_chunk(b'IHDR', header),
+        _png_chunk(b'IDAT', b''.join(image_data)),
+        _png_chunk(b'IEND', b''),
+    ]))
+
+
+def rs_encode_polynomial_division(block, num_ecc):
+    """Reference implementation of rs_encode with polynomial long division"""
+    generator_poly = get_generator_polynomial(num_ecc).to_exp()
+    message_poly = Polynomial_GF256_int(block).copy_with_increased_degree(num_ecc)
+    while len(message_poly) > num_ecc:
+        if message_poly[0] == 0:
+            message_poly = Polynomial_GF256_int(message_poly[1:])
+            continue
+        degree_difference = len(message_poly) - len(generator_poly)
+        resized_gen = generator_poly.copy_with_increased_degree(degree_difference)
+        resized_gen = resized_gen.multiply_by(LOG[message_poly[0]])
+        message_poly = Polynomial_GF256_int(message_poly ^ resized_gen.to_int())[1:]
+        message_poly = Polynomial_GF256_int(message_poly)
+    return bytearray(message_poly)
+
+
+def benchmark_rs():
+    """Compare rs_encode to the long division for every block size used by QR codes"""
+    import random
+    import time
+    from .qr_tables import ECC_INFO_TABLE
+
+    random.seed(0)
+    block_sizes = sorted({
+        (num_ecc, block_len)
+        for version in ECC_INFO_TABLE
+        for num_ecc, _, block_len_1, _, block_len_2 in version
+        for block_len in (block_len_1, block_len_2) if block_len
+    })
+    print(f'{"ecc":>4} {"data":>5} {"division µs":>12} {"lfsr µs":>8} {"speedup":>8}')
+    for num_ecc, block_len in block_sizes:
+        blocks = [bytes(random.randrange(256) for _ in range(block_len)) for _ in range(20)]
+        # Fill the caches
+        rs_encode(blocks[0], num_ecc)
+        start = time.perf_counter()
+        reference = [rs_encode_polynomial_division(block, num_ecc) for block in blocks]
+        division = (time.perf_counter() - start) / len(blocks) * 1e6
+        start = time.perf_counter()
+        for _ in range(10):
+            result = [rs_encode(block, num_ecc) for block in blocks]
+        lfsr = (time.perf_counter() - start) / len(blocks) / 10 * 1e6
+        assert result == reference
+        print(f'{num_ecc:>4} {block_len:>5} {division:>12.1f} {lfsr:>8.1f} {division/lfsr:>7.0f}x')
+
+
+def get_matrix_png_paste(matrix, module_width_px=10):
+    """Reference implementation of get_matrix_png that pastes every module separately"""
+    width = matrix.size + 2
+    img = Image.new('RGB', (module_width_px * width, module_width_px * width), 'white')
+    for y in range(matrix.size):
+        posy = (y + 1) * module_width_px
+        for x in range(matrix.size):
+            posx = (x + 1) * module_width_px
+            color = 'white' if matrix[x, y] == 0 else 'black'
+            img.paste(color, (posx, posy, posx + module_width_px, posy + module_width_px))
     image_bytes = BytesIO()
     img.save(image_bytes, 'png')
-
     return image_bytes
 
 
+def benchmark_png():
+    """Compare get_matrix_png to the paste based rasterizer for some versions and pixel sizes"""
+    import random
+    import time
+
+    random.seed(0)
+    print(f'{"version":>7} {"px":>3} {"paste ms":>9} {"KiB":>6} {"1-bit ms":>9} {"KiB":>6} '
+          f'{"speedup":>8}')
+    for version in (1, 10, 25, 40):
+        size = 17 + 4 * version
+        matrix = QRMatrix(size, bytearray(random.getrandbits(1) for _ in range(size * size)))
+        for pixel_size in (1, 10, 50):
+            results = []
+            for rasterizer in (get_matrix_png_paste, get_matrix_png):
+                runs = 0
+                start = time.perf_counter()
+                while runs < 3 or time.perf_counter() - start < 0.2:
+                    png = rasterizer(matrix, pixel_size).getvalue()
+                    runs += 1
+                results.append(((time.perf_counter() - start) / runs, len(png), png))
+            (paste, paste_len, paste_png), (fast, fast_len, fast_png) = results
+            paste_img = Image.open(BytesIO(paste_png)).convert('RGB')
+            fast_img = Image.open(BytesIO(fast_png)).convert('RGB')
+            assert paste_img.tobytes() == fast_img.tobytes()
+            print(f'{version:>7} {pixel_size:>3} {paste * 1e3:>9.1f} {paste_len / 1024:>6.1f} '
+                  f'{fast * 1e3:>9.2f} {fast_len / 1024:>6.1f} {paste / fast:>7.0f}x')
+
+
 if __name__ == '__main__':
+    import sys
+    # python -m tools.qr_tools benchmark [rs|png]
+    if sys.argv[1:2] == ['benchmark']:
+        if sys.argv[2:] in ([], ['rs']):
+            benchmark_rs()
+        if sys.argv[2:] in ([], ['png']):
+            benchmark_png()
+        sys.exit()
+
     l, al = GF2_create_tables(256, 285)
     print(l)
     print(al)
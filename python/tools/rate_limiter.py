@@ -0,0 +1,83 @@
+"""Sliding window rate limiter with bounded memory
+
+For every key (e.g. a member id) the limiter keeps the timestamps of the last `limit`
+events in a small ring buffer. An event trips the limiter if `limit` events happened
+within `window` seconds.
+
+Entries are kept in the order of their last event. Entries whose last event is older than
+the window can never trip the limiter again and are evicted from the front on every event,
+and if there are more than max_entries entries the least recently active ones are dropped.
+So memory depends on the number of members that were active within the window, not on the
+number of members that were ever seen.
+"""
+
+from array import array
+from collections import OrderedDict
+
+# Hard cap for the number of tracked keys
+MAX_ENTRIES = 50000
+
+
+class _Window:
+    __slots__ = ('stamps', 'index', 'count', 'last')
+
+    def __init__(self, limit):
+        self.stamps = array('d', bytes(8 * limit))
+        self.index = 0
+        self.count = 0
+        self.last = 0.0
+
+
+class RateLimiter:
+    def __init__(self, limit, window, max_entries=MAX_ENTRIES):
+        """
+        Arguments:
+            limit {int} -- Number of events that trip the limiter
+            window {float} -- ... if they happen within this many seconds
+
+        Keyword Arguments:
+            max_entries {int} -- Maximum number of tracked keys (default: {MAX_ENTRIES})
+        """
+        self.limit = limit
+        self.window = window
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def hit(self, key, now):
+        """Record an event for key, return True if the limit was exceeded"""
+        self.evict(now)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = _Window(self.limit)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+        entry.stamps[entry.index] = now
+        entry.index = (entry.index + 1) % self.limit
+        entry.last = now
+        if entry.count < self.limit:
+            entry.count += 1
+            if entry.count < self.limit:
+                return False
+        # The ring is full, the next slot holds the event from limit - 1 events ago
+        return now - entry.stamps[entry.index] < self.window
+
+    def reset(self, key):
+        """Forget all events of key"""
+        self.entries.pop(key, None)
+
+    def evict(self, now):
+        """Drop all entries that did not have an event within the window"""
+        entries = self.entries
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if now - entry.last < self.window:
+                break
+            del entries[key]
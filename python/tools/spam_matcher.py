@@ -0,0 +1,245 @@
+"""Multi pattern matcher for the spam rule set
+
+Instead of running every spam regex against every message, the literal substrings that a
+rule requires in order to match are extracted from its regex once. All of those literals are
+compiled into a single Aho-Corasick automaton, so one pass over the message text yields the
+(usually empty) set of candidate rules. Only the candidates are then confirmed with their
+actual regex. Rules without a usable literal are always confirmed with their regex.
+
+Run `python -m tools.spam_matcher` from the python folder for a benchmark.
+"""
+
+import re
+from dataclasses import dataclass, field
+from collections import deque
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# Shortest literal that is worth using as a prefilter
+MIN_LITERAL_LENGTH = 3
+
+# Non ASCII characters that re.IGNORECASE treats as equal to an ASCII letter
+# These have to be folded before .lower() so that the literals can still be found
+IGNORECASE_FOLD = str.maketrans({
+    'İ': 'i',  # LATIN CAPITAL LETTER I WITH DOT ABOVE
+    'ı': 'i',  # LATIN SMALL LETTER DOTLESS I
+    'ſ': 's',  # LATIN SMALL LETTER LONG S
+    'K': 'k',  # KELVIN SIGN
+})
+
+_REPEATS = tuple(
+    op for op in (
+        sre_parse.MAX_REPEAT,
+        sre_parse.MIN_REPEAT,
+        getattr(sre_parse, 'POSSESSIVE_REPEAT', None),
+    ) if op is not None
+)
+_ATOMIC_GROUP = getattr(sre_parse, 'ATOMIC_GROUP', None)
+
+
+@dataclass
+class SpamRule:
+    id: int
+    regex: str
+    compiled: re.Pattern = field(repr=False)
+
+
+def normalize(text):
+    """Fold text the same way the matcher folds its literals"""
+    if not text.isascii():
+        text = text.translate(IGNORECASE_FOLD)
+    return text.lower()
+
+
+def _best(candidates):
+    """Return the literal set whose shortest literal is the longest"""
+    candidates = [c for c in candidates if c]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda c: min(len(s) for s in c))
+
+
+def required_literals(parsed):
+    """Return a set of lowercase literals of which at least one must occur in any match
+
+    Returns None if no such set could be found.
+    """
+    candidates = []
+    run = []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL and av < 128:
+            run.append(chr(av))
+            continue
+        if run:
+            candidates.append({''.join(run).lower()})
+            run = []
+        if op is sre_parse.SUBPATTERN:
+            candidates.append(required_literals(av[-1]))
+        elif op in _REPEATS:
+            min_repeat, _, item = av
+            if min_repeat >= 1:
+                candidates.append(required_literals(item))
+        elif op is sre_parse.BRANCH:
+            branches = [required_literals(item) for item in av[1]]
+            if all(branches):
+                candidates.append(set().union(*branches))
+        elif _ATOMIC_GROUP is not None and op is _ATOMIC_GROUP:
+            candidates.append(required_literals(av))
+    if run:
+        candidates.append({''.join(run).lower()})
+    return _best(candidates)
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton that reports which of its words occur in a text"""
+
+    def __init__(self, words):
+        # goto[node] maps a character to the next node
+        # out[node] is the set of word indices that end at this node (including via fail links)
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [set()]
+        for index, word in enumerate(words):
+            node = 0
+            for char in word:
+                nxt = self.goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][char] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(set())
+                node = nxt
+            self.out[node].add(index)
+
+        # Breadth first traversal to set up the failure links
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self.goto[node].items():
+                queue.append(nxt)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(char, 0)
+                self.out[nxt] |= self.out[self.fail[nxt]]
+
+    def search(self, text):
+        """Return the set of indices of all words that occur in text"""
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node]:
+                found |= out[node]
+        return found
+
+
+class SpamMatcher:
+    """Compiled representation of all spam rules
+
+    rules is an iterable of (rule_id, regex_string) tuples. The order of the rules is kept,
+    match() returns the first matching rule in that order.
+    """
+
+    def __init__(self, rules):
+        self.rules = []
+        # Indices of rules that have to be checked for every message
+        self.unfiltered = []
+        literals = {}
+        for rule_id, regex in rules:
+            compiled = re.compile(regex, re.I)
+            index = len(self.rules)
+            self.rules.append(SpamRule(rule_id, regex, compiled))
+            required = required_literals(sre_parse.parse(regex, re.I))
+            if not required or min(len(s) for s in required) < MIN_LITERAL_LENGTH:
+                self.unfiltered.append(index)
+                continue
+            for literal in required:
+                literals.setdefault(literal, []).append(index)
+        self.literal_rules = list(literals.values())
+        self.automaton = AhoCorasick(literals.keys())
+
+    def __len__(self):
+        return len(self.rules)
+
+    def candidates(self, text):
+        """Return the indices of the rules that could match text in rule order"""
+        candidates = set(self.unfiltered)
+        for literal_index in self.automaton.search(normalize(text)):
+            candidates.update(self.literal_rules[literal_index])
+        return sorted(candidates)
+
+    def match(self, text):
+        """Return the first SpamRule that matches text or None"""
+        for index in self.candidates(text):
+            rule = self.rules[index]
+            if rule.compiled.search(text):
+                return rule
+        return None
+
+    def match_all(self, text):
+        """Return a list of all SpamRules that match text"""
+        return [
+            self.rules[index] for index in self.candidates(text)
+            if self.rules[index].compiled.search(text)
+        ]
+
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    random.seed(0)
+    WORDS = (
+        'hey anyone know how to fix this error in my python code lol the build broke again '
+        'check out my repo on github it has a cool discord bot written in rust and go '
+        'free nitro steam gift airdrop claim your reward before it expires today'
+    ).split()
+    TLDS = ('com', 'gift', 'ru', 'xyz', 'net', 'org', 'click')
+
+    def random_rule():
+        name = ''.join(random.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(6))
+        kind = random.randrange(4)
+        if kind == 0:
+            return rf'{name}-?nitro\.{random.choice(TLDS)}'
+        if kind == 1:
+            return rf'(?:disc|dlsc)[o0]rd-{name}\.(?:com|gift)'
+        if kind == 2:
+            return rf'steamcommun[il1]ty\.{name}'
+        return rf'https?://(?:www\.)?{name}\.{random.choice(TLDS)}/\S*'
+
+    def random_message(rules):
+        words = random.choices(WORDS, k=random.randint(3, 40))
+        if random.random() < 0.02:
+            words.append(f'https://www.{random.choice(rules)[1][-20:]}')
+        return ' '.join(words)
+
+    print(f'{"rules":>6} {"naive µs/msg":>14} {"matcher µs/msg":>16} {"build ms":>10}')
+    for num_rules in (10, 100, 1000):
+        rules = [(i, random_rule()) for i in range(num_rules)]
+        corpus = [random_message(rules) for _ in range(2000)]
+
+        naive = {regex: re.compile(regex, re.I) for _, regex in rules}
+        start = time.perf_counter()
+        for msg in corpus:
+            for regex in naive.values():
+                if regex.findall(msg):
+                    break
+        naive_time = (time.perf_counter() - start) / len(corpus) * 1e6
+
+        start = time.perf_counter()
+        matcher = SpamMatcher(rules)
+        build_time = (time.perf_counter() - start) * 1e3
+        start = time.perf_counter()
+        for msg in corpus:
+            matcher.match(msg)
+        matcher_time = (time.perf_counter() - start) / len(corpus) * 1e6
+
+        print(f'{num_rules:>6} {naive_time:>14.1f} {matcher_time:>16.1f} {build_time:>10.1f}')
@@ -0,0 +1,104 @@
+"""In-memory store for the contents of state.json
+
+The file is read once at startup. All reads are served from memory and writes are
+debounced: every change schedules a save, and all changes that happen until the save runs
+are written together. The file is written to a temporary file first and then renamed, so a
+crash during the write can never leave a truncated state.json behind.
+
+There is only one instance (client.state) and all changes to it happen on the event loop,
+so cogs can not overwrite each other's changes anymore.
+"""
+
+import asyncio
+import json
+import os
+
+STATE_FILE = '../state.json'
+# Seconds to wait for more changes before writing the file
+SAVE_DELAY = 2
+
+
+class StateStore:
+    def __init__(self, path=STATE_FILE, save_delay=SAVE_DELAY):
+        self.path = path
+        self.save_delay = save_delay
+        with open(path, 'r') as statefile:
+            self.data = json.load(statefile)
+        self._dirty = False
+        self._save_handle = None
+        self._lock = None
+
+    # ----------------------------------------------
+    # Generic access
+    # ----------------------------------------------
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        self.data[key] = value
+        self.schedule_save()
+
+    def pop(self, key, default=None):
+        value = self.data.pop(key, default)
+        self.schedule_save()
+        return value
+
+    # ----------------------------------------------
+    # Saving
+    # ----------------------------------------------
+    def schedule_save(self):
+        """Save the state after save_delay seconds (if no save is scheduled already)"""
+        self._dirty = True
+        if self._save_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not running inside the bot - just write the file right away
+            self._write(self._dump())
+            self._dirty = False
+            return
+        self._save_handle = loop.call_later(
+            self.save_delay, lambda: asyncio.ensure_future(self._scheduled_flush())
+        )
+
+    async def _scheduled_flush(self):
+        try:
+            await self.flush()
+        except OSError as e:
+            print(f'Failed to save {self.path}: {e!r}')
+            # The changes are still in memory, try again later
+            self.schedule_save()
+
+    async def flush(self):
+        """Write all pending changes to disk"""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._dirty:
+                return
+            # Serialize on the event loop so the snapshot is consistent,
+            # the actual file IO happens in a thread. Changes made during the write
+            # set _dirty again and are written by the next save.
+            self._dirty = False
+            dump = self._dump()
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, dump)
+            except BaseException:
+                # The changes of this snapshot are not on disk
+                self._dirty = True
+                raise
+
+    def _dump(self):
+        return json.dumps(self.data, indent=1)
+
+    def _write(self, dump):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as statefile:
+            statefile.write(dump)
+            statefile.flush()
+            os.fsync(statefile.fileno())
+        os.replace(tmp_path, self.path)
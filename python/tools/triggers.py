@@ -0,0 +1,46 @@
+"""Matcher for message triggers (easter eggs and canned responses)
+
+All trigger patterns are combined into one alternation that is compiled once. Most messages
+don't contain any trigger and are rejected by a single scan of that combined pattern. Only
+if it matches, the individual patterns are checked (in table order) to find out which
+triggers fired - a message can fire more than one trigger.
+"""
+
+import re
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Trigger:
+    name: str
+    pattern: str
+    # Either the text to send or a function that is called with the cog and returns the text
+    response: object = field(repr=False)
+    compiled: re.Pattern = field(default=None, repr=False)
+
+
+class TriggerEngine:
+    def __init__(self, triggers, flags=re.I):
+        self.triggers = []
+        for trigger in triggers:
+            trigger.compiled = re.compile(trigger.pattern, flags)
+            self.triggers.append(trigger)
+        try:
+            self.combined = re.compile(
+                '|'.join(f'(?:{trigger.pattern})' for trigger in self.triggers), flags
+            )
+        except re.error:
+            # e.g. two patterns that use the same group name or inline flags,
+            # the triggers are still checked one by one in that case
+            self.combined = None
+
+    def __len__(self):
+        return len(self.triggers)
+
+    def matches(self, text):
+        """Return the triggers that match text in table order"""
+        if not self.triggers:
+            return []
+        if self.combined is not None and not self.combined.search(text):
+            return []
+        return [trigger for trigger in self.triggers if trigger.compiled.search(text)]
@@ -0,0 +1,130 @@
+"""Mapping with expiring entries and bounded memory
+
+Every entry expires ttl seconds after it was set. Expired entries are treated as missing
+right away and are removed from the front of a heap of expiry times whenever the map is
+changed, so the map only holds entries that were set within the last ttl seconds. If there
+are more than max_entries entries the ones that expire first are dropped.
+
+Changing the expiry time of a key leaves its old heap entry behind, those are skipped when
+they reach the front and the heap is rebuilt when most of it is stale.
+
+Named maps are listed in TTL_MAPS (see the `pipeline maps` command).
+"""
+
+import heapq
+import time
+import weakref
+from dataclasses import dataclass
+
+# Default cap for the number of entries
+MAX_ENTRIES = 50000
+
+# name -> TTLMap of all named maps
+TTL_MAPS = weakref.WeakValueDictionary()
+
+
+@dataclass
+class TTLMapStats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evicted: int = 0
+
+
+class TTLMap:
+    def __init__(self, ttl, max_entries=MAX_ENTRIES, name=None, clock=time.monotonic):
+        """
+        Arguments:
+            ttl {float} -- Seconds until an entry expires
+
+        Keyword Arguments:
+            max_entries {int} -- Maximum number of entries (default: {MAX_ENTRIES})
+            name {str} -- Name in TTL_MAPS (default: {None})
+            clock {callable} -- Returns the current time (default: {time.monotonic})
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        # key -> (expires, value)
+        self.entries = {}
+        # (expires, key), may contain stale entries of keys that were set again or removed
+        self.heap = []
+        self.stats = TTLMapStats()
+        self.name = name
+        if name is not None:
+            TTL_MAPS[name] = self
+
+    def __len__(self):
+        self.expire()
+        return len(self.entries)
+
+    def __contains__(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and entry[0] > self.clock()
+
+    def __getitem__(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= self.clock():
+            raise KeyError(key)
+        return entry[1]
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        del self.entries[key]
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= self.clock():
+            self.stats.misses += 1
+            return default
+        self.stats.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Set key to value, it expires after ttl (default: self.ttl) seconds"""
+        now = self.clock()
+        self.expire(now)
+        expires = now + (self.ttl if ttl is None else ttl)
+        self.entries[key] = (expires, value)
+        heapq.heappush(self.heap, (expires, key))
+        while len(self.entries) > self.max_entries:
+            if self._pop_first():
+                self.stats.evicted += 1
+        if len(self.heap) > 2 * len(self.entries) + 64:
+            self.heap = [(expires, key) for key, (expires, _) in self.entries.items()]
+            heapq.heapify(self.heap)
+
+    def pop(self, key, default=None):
+        entry = self.entries.pop(key, None)
+        if entry is None or entry[0] <= self.clock():
+            return default
+        return entry[1]
+
+    def items(self):
+        now = self.clock()
+        return [(key, value) for key, (expires, value) in self.entries.items() if expires > now]
+
+    def clear(self):
+        self.entries.clear()
+        self.heap.clear()
+
+    def expire(self, now=None):
+        """Remove all expired entries"""
+        if now is None:
+            now = self.clock()
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            if self._pop_first():
+                self.stats.expired += 1
+
+    def _pop_first(self):
+        """Remove the entry that expires first, returns False for a stale heap entry"""
+        expires, key = heapq.heappop(self.heap)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != expires:
+            return False
+        del self.entries[key]
+        return True
+